@@ -1,15 +1,21 @@
 # chat_agent.py
+import asyncio
 import os
 import sys
+import time
 
 # Use absolute import for the utils module
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.google_llm import create_google_llm
 from utils.ollama_llm import create_ollama_llm
+from utils.llm_router import create_router_llm
+from utils.chat_history import create_history_manager
+from utils.context_builder import count_tokens, create_context_builder
 
 from langchain_community.embeddings import OllamaEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_openai import ChatOpenAI
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 
 
@@ -51,47 +57,58 @@ class ChatAgent:
         else:
             self.embeddings = embeddings
         
-        # Three-tier LLM provider selection for Chat
+        # Three-tier LLM provider selection for Chat; every provider that
+        # initializes is kept and calls are routed between them at runtime.
         if llm is None:
+            providers = []
             # Tier 1: Try Ollama first
             try:
                 print("🔵 Chat: Attempting Tier 1 (Ollama)")
-                self.llm = create_ollama_llm()
-                print("✅ Chat: Using Ollama LLM")
+                providers.append(("Ollama", create_ollama_llm()))
+                print("✅ Chat: Ollama LLM available")
             except Exception as e:
                 print(f"❌ Chat: Ollama failed: {e}")
-                self.llm = None
             
             # Tier 2: Try Google Gemini
-            if self.llm is None and os.environ.get("GOOGLE_API_KEY"):
+            if os.environ.get("GOOGLE_API_KEY"):
                 try:
                     print("🔵 Chat: Attempting Tier 2 (Google Gemini)")
-                    self.llm = create_google_llm()
-                    print("✅ Chat: Using Google Gemini LLM")
+                    providers.append(("Google Gemini", create_google_llm(api_key=os.environ["GOOGLE_API_KEY"])))
+                    print("✅ Chat: Google Gemini LLM available")
                 except Exception as e:
                     print(f"❌ Chat: Google Gemini failed: {e}")
-                    self.llm = None
             
             # Tier 3: Try OpenAI
-            if self.llm is None and os.environ.get("OPENAI_API_KEY"):
+            if os.environ.get("OPENAI_API_KEY"):
                 try:
                     print("🔵 Chat: Attempting Tier 3 (OpenAI)")
-                    self.llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0.1)
-                    print("✅ Chat: Using OpenAI LLM")
+                    providers.append(("OpenAI", ChatOpenAI(model_name="gpt-4o-mini", temperature=0.1)))
+                    print("✅ Chat: OpenAI LLM available")
                 except Exception as e:
                     print(f"❌ Chat: OpenAI failed: {e}")
-                    self.llm = None
             
             # If all tiers failed
-            if self.llm is None:
+            if not providers:
                 print("❌ Chat: All LLM providers failed!")
                 raise RuntimeError("No available LLM provider for Chat Agent")
+            self.llm = create_router_llm(providers)
         else:
             self.llm = llm
         
         self.faiss_index_path = faiss_index_path
+        # Retrieved candidates are deduplicated, reranked and packed to a token budget.
+        self.context_builder = create_context_builder(self.embeddings, self.llm)
+        # Long conversations keep recent turns verbatim and summarize the rest.
+        self.history = create_history_manager(self.llm)
 
-    def build_chain(self, retriever):
+    def build_chain(self, retriever, answer_cache=None, index_version=None):
+        """
+        Build a conversational chain over retriever.
+
+        If answer_cache is given, answers are looked up in and stored to it
+        under index_version, so repeated questions skip retrieval and
+        generation entirely.
+        """
         system_prompt = """You are a helpful study assistant. Your goal is to provide clear, concise, and comprehensive answers based on the provided context.
 
 When answering, please follow these guidelines:
@@ -104,33 +121,170 @@ If you don't know the answer from the context, simply state that the information
 """
         
         class SimpleConversationalChain:
-            def __init__(self, llm, retriever, system_prompt):
+            def __init__(self, llm, retriever, system_prompt, answer_cache=None, index_version=None,
+                         context_builder=None, history=None):
                 self.llm = llm
                 self.retriever = retriever
                 self.system_prompt = system_prompt
+                self.context_builder = context_builder
+                self.history = history
+                self.answer_cache = answer_cache
+                self.index_version = index_version
+            
+            def _cached(self, question, chat_history):
+                if self.answer_cache is None:
+                    return None
+                try:
+                    return self.answer_cache.lookup(question, self.index_version, chat_history)
+                except Exception as e:
+                    print(f"⚠️  Answer cache lookup failed: {e}")
+                    return None
+            
+            def _remember(self, question, chat_history, answer, docs):
+                if self.answer_cache is None:
+                    return
+                try:
+                    sources = [d.page_content for d in docs]
+                    self.answer_cache.store(question, self.index_version, chat_history, answer, sources)
+                except Exception as e:
+                    print(f"⚠️  Answer cache store failed: {e}")
+            
+            def _compact(self, chat_history):
+                """Return (summary of older turns, recent turns) for the prompt."""
+                if self.history is None:
+                    return "", list(chat_history or [])
+                return self.history.compact(chat_history)
+            
+            def _prepare(self, chat_history, question, answer):
+                """Start summarizing ahead of the next turn, which will resend this one."""
+                if self.history is not None:
+                    self.history.prepare(list(chat_history or []) + [(question, answer)])
+            
+            def _select(self, question, summary, recent, docs):
+                """Reduce retrieved candidates to the documents that fit the context budget."""
+                if self.context_builder is None:
+                    return docs
+                prompt_tokens = count_tokens(self.system_prompt) + count_tokens(question) + count_tokens(summary)
+                for q, a in recent:
+                    prompt_tokens += count_tokens(q) + count_tokens(a)
+                return self.context_builder.select(question, docs, prompt_tokens)
+            
+            @staticmethod
+            def _from_cache(hit):
+                return {
+                    "answer": hit["answer"],
+                    "source_documents": [Document(page_content=s) for s in hit["sources"]],
+                    "cached": True,
+                }
             
             def __call__(self, *args, **kwargs):
                 question = kwargs.get("question") or (args[0] if args else "")
                 chat_history = kwargs.get("chat_history", [])
                 
-                docs = self.retriever.invoke(question)
+                hit = self._cached(question, chat_history)
+                if hit is not None:
+                    return self._from_cache(hit)
+                
+                summary, recent = self._compact(chat_history)
+                docs = self._select(question, summary, recent, self.retriever.invoke(question))
+                messages = self._build_messages(question, summary, recent, docs)
+                response = self.llm.invoke(messages)
+                answer = response.content if hasattr(response, 'content') else str(response)
+                self._remember(question, chat_history, answer, docs)
+                self._prepare(chat_history, question, answer)
+                
+                return {
+                    "answer": answer,
+                    "source_documents": docs,
+                    "cached": False,
+                }
+            
+            async def acall(self, question, chat_history=None):
+                """Async variant of __call__ that does not block the event loop."""
+                chat_history = chat_history or []
+                hit = await asyncio.to_thread(self._cached, question, chat_history)
+                if hit is not None:
+                    return self._from_cache(hit)
+                
+                summary, recent = self._compact(chat_history)
+                docs = await self.retriever.ainvoke(question)
+                docs = await asyncio.to_thread(self._select, question, summary, recent, docs)
+                messages = self._build_messages(question, summary, recent, docs)
+                response = await self.llm.ainvoke(messages)
+                answer = response.content if hasattr(response, 'content') else str(response)
+                await asyncio.to_thread(self._remember, question, chat_history, answer, docs)
+                self._prepare(chat_history, question, answer)
+                
+                return {
+                    "answer": answer,
+                    "source_documents": docs,
+                    "cached": False,
+                }
+            
+            async def astream(self, question, chat_history=None):
+                """
+                Stream an answer as events: the retrieved sources first, then
+                each token as the provider emits it, then a final summary.
+                """
+                start = time.perf_counter()
+                chat_history = chat_history or []
+                hit = await asyncio.to_thread(self._cached, question, chat_history)
+                if hit is not None:
+                    yield {"type": "sources", "sources": hit["sources"]}
+                    yield {"type": "token", "token": hit["answer"]}
+                    elapsed = round(time.perf_counter() - start, 3)
+                    yield {
+                        "type": "done",
+                        "answer": hit["answer"],
+                        "cached": True,
+                        "time_to_first_token": elapsed,
+                        "total_time": elapsed,
+                    }
+                    return
+                
+                summary, recent = self._compact(chat_history)
+                docs = await self.retriever.ainvoke(question)
+                docs = await asyncio.to_thread(self._select, question, summary, recent, docs)
+                yield {"type": "sources", "sources": [d.page_content for d in docs]}
+                
+                messages = self._build_messages(question, summary, recent, docs)
+                parts = []
+                first_token_at = None
+                async for chunk in self.llm.astream(messages):
+                    token = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                    if not token:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    parts.append(token)
+                    yield {"type": "token", "token": token}
+                
+                answer = "".join(parts)
+                await asyncio.to_thread(self._remember, question, chat_history, answer, docs)
+                self._prepare(chat_history, question, answer)
+                yield {
+                    "type": "done",
+                    "answer": answer,
+                    "cached": False,
+                    "time_to_first_token": round(first_token_at - start, 3) if first_token_at else None,
+                    "total_time": round(time.perf_counter() - start, 3),
+                }
+            
+            def _build_messages(self, question, summary, recent, docs):
                 context = "\n".join([doc.page_content for doc in docs])
                 
                 messages = [
                     {"role": "system", "content": self.system_prompt},
                 ]
-                if chat_history:
-                    for q, a in chat_history:
+                if summary:
+                    messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+                if recent:
+                    for q, a in recent:
                         messages.append({"role": "user", "content": q})
                         messages.append({"role": "assistant", "content": a})
                 
                 messages.append({"role": "user", "content": f"Based on the following context, please answer the question.\n\nContext:\n---\n{context}\n---\n\nQuestion: {question}"})
-                
-                response = self.llm.invoke(messages)
-                
-                return {
-                    "answer": response.content if hasattr(response, 'content') else str(response),
-                    "source_documents": docs
-                }
+                return messages
         
-        return SimpleConversationalChain(self.llm, retriever, system_prompt)
+        return SimpleConversationalChain(self.llm, retriever, system_prompt, answer_cache, index_version,
+                                         self.context_builder, self.history)
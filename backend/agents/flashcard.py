@@ -9,6 +9,16 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.google_llm import create_google_llm
+from utils.parallel import concurrency_for, map_ordered
+from utils.batching import (
+    batch_budget_for,
+    chunk_progress,
+    estimate_tokens,
+    format_packed_chunks,
+    pack_chunks,
+    parse_keyed_json,
+    resolve_batch_size,
+)
 
 FLASH_PROMPT = """You are a flashcard generator.
 Given the following text chunk, produce between 1 and 6 question-answer pairs and return them as a valid JSON array.
@@ -39,8 +49,41 @@ Text to use for generating flashcards:
 Return strictly a JSON array.
 """
 
+FLASH_BATCH_PROMPT = """You are a flashcard generator.
+You are given several text chunks, each wrapped in <chunk id="N"> tags. For each chunk, produce between 1 and 6 question-answer pairs drawn only from that chunk, and return them as a valid JSON object keyed by chunk id.
+
+Requirements:
+- Output must be a single valid JSON object using double quotes only.
+- Each key must be a chunk id (as a string) and each value a JSON array of flashcards for that chunk.
+- Include every chunk id. Use an empty array for a chunk with no suitable Q/A.
+- Each flashcard must be an object with three keys: "question", "answer", and "explanation".
+- The "explanation" should provide additional context or clarify the answer.
+- Keep questions concise (<= 120 characters) and answers concise (<= 400 characters).
+- Do NOT include any explanatory text, markdown, or code fences — output only the JSON object.
+- Escape any quotes or special characters so the JSON is valid.
+
+Example output:
+{{
+    "1": [
+        {{
+            "question": "What is the capital of France?",
+            "answer": "Paris",
+            "explanation": "Paris is the capital and most populous city of France."
+        }}
+    ],
+    "2": []
+}}
+
+Text chunks to use for generating flashcards:
+
+{chunks}
+
+
+Return strictly a JSON object.
+"""
+
 class FlashcardAgent:
-    def __init__(self, llm=None):
+    def __init__(self, llm=None, max_concurrency=None, batch_size=None):
         # If an explicit llm is provided (e.g., ChatOpenAI), use it. Otherwise
         # create a Google Gemini wrapper that exposes predict(). This keeps
         # backwards compatibility.
@@ -48,11 +91,18 @@ class FlashcardAgent:
             self.llm = create_google_llm()
             # self.chain will be a thin wrapper that calls self.llm.predict
             self.chain = None
+            self.batch_chain = None
         else:
             self.llm = llm
             # Use modern LangChain pattern: prompt | llm
             prompt = PromptTemplate.from_template(FLASH_PROMPT)
             self.chain = prompt | self.llm
+            self.batch_chain = PromptTemplate.from_template(FLASH_BATCH_PROMPT) | self.llm
+        # Number of chunks sent to the LLM at once; defaults per provider.
+        self.max_concurrency = max_concurrency or concurrency_for(self.llm)
+        # Chunks packed into one prompt: an int, "auto" (fit the model's
+        # limits) or None to read GENERATION_BATCH_SIZE. 1 disables packing.
+        self.batch_size = batch_size
 
     def _response_to_text(self, resp):
         """
@@ -80,63 +130,132 @@ class FlashcardAgent:
                 return str(resp)
         return str(resp)
 
-    def generate_from_chunks(self, chunks):
+    def generate_from_chunks(self, chunks, on_progress=None):
+        """
+        Generate flashcards for every chunk, keeping the input order.
+
+        Chunks are processed concurrently up to self.max_concurrency; a chunk
+        that fails contributes no cards. on_progress(done, total) is called as
+        each chunk finishes.
+        """
         print("***FlashcardAgent generating from chunks...")
-        out = []
-        for c in chunks:
-            # Use .predict to avoid deprecated Chain.__call__/run usage.
-            # LLMChain.predict accepts kwargs for template variables.
-            print("***FlashcardAgent processing chunk...")
-            # If using GoogleLLM wrapper, call predict directly; otherwise use chain
+        batch_size = resolve_batch_size(self.batch_size)
+        if batch_size != 1:
+            return self._generate_packed(chunks, batch_size, on_progress)
+        results = map_ordered(self._generate_one, chunks, self.max_concurrency, on_progress)
+        return [card for cards in results if cards for card in cards]
+
+    def _generate_packed(self, chunks, batch_size, on_progress=None):
+        """
+        Generate flashcards with several chunks packed into each prompt.
+
+        Groups are sized to the model's context and output limits, capped at
+        batch_size when one is given. Chunks the model skips or whose group
+        cannot be parsed are retried one at a time.
+        """
+        avg_tokens = sum(estimate_tokens(c) for c in chunks) // max(len(chunks), 1)
+        max_chunks, max_input = batch_budget_for(self.llm, avg_tokens)
+        if batch_size:
+            # A configured size caps the group; it never exceeds the model's budget.
+            max_chunks = min(max_chunks, batch_size)
+        groups = pack_chunks(chunks, max_chunks, max_input)
+        print(f"***FlashcardAgent packing {len(chunks)} chunks into {len(groups)} prompts")
+        report = chunk_progress(len(chunks), on_progress)
+
+        def run(group):
             try:
-                if self.chain is None:
-                    resp = self.llm.predict(FLASH_PROMPT.replace("{chunk}", c))
-                else:
-                    # Use invoke with modern LangChain (prompt | llm)
-                    result = self.chain.invoke({"chunk": c})
-                    resp = result.content if hasattr(result, 'content') else str(result)
-            except Exception as e:
-                print("***FlashcardAgent exception during prediction/invocation", e)
-                resp = ""
-            text = self._response_to_text(resp)
-            print(f"***FlashcardAgent processed text: {text}")
-            # try strict JSON parse first
+                return self._generate_group([chunks[i] for i in group])
+            finally:
+                report(len(group))
+
+        results = map_ordered(run, groups, self.max_concurrency)
+        return [card for group_cards in results if group_cards for cards in group_cards for card in cards]
+
+    def _generate_group(self, group):
+        """
+        Return one list of flashcards per chunk in group, in order.
+
+        Chunks the response leaves out are retried together in one prompt;
+        a response with nothing usable is retried as two halves, so one bad
+        group costs a few extra calls rather than one per chunk.
+        """
+        if len(group) == 1:
+            return [self._generate_one(group[0])]
+        packed = format_packed_chunks(group)
+        try:
+            if self.chain is None:
+                resp = self.llm.predict(FLASH_BATCH_PROMPT.replace("{chunks}", packed))
+            else:
+                result = self.batch_chain.invoke({"chunks": packed})
+                resp = result.content if hasattr(result, 'content') else str(result)
+        except Exception as e:
+            print("***FlashcardAgent exception during packed invocation", e)
+            resp = ""
+        by_id = parse_keyed_json(self._response_to_text(resp)) or {}
+        missing = [c for i, c in enumerate(group, 1) if i not in by_id]
+        if len(missing) == len(group):
+            mid = len(group) // 2
+            return self._generate_group(group[:mid]) + self._generate_group(group[mid:])
+        retried = iter(self._generate_group(missing) if missing else [])
+        return [
+            [card for card in by_id[i] if isinstance(card, dict)] if i in by_id else next(retried)
+            for i in range(1, len(group) + 1)
+        ]
+
+    def _generate_one(self, c):
+        # Use .predict to avoid deprecated Chain.__call__/run usage.
+        # LLMChain.predict accepts kwargs for template variables.
+        print("***FlashcardAgent processing chunk...")
+        # If using GoogleLLM wrapper, call predict directly; otherwise use chain
+        try:
+            if self.chain is None:
+                resp = self.llm.predict(FLASH_PROMPT.replace("{chunk}", c))
+            else:
+                # Use invoke with modern LangChain (prompt | llm)
+                result = self.chain.invoke({"chunk": c})
+                resp = result.content if hasattr(result, 'content') else str(result)
+        except Exception as e:
+            print("***FlashcardAgent exception during prediction/invocation", e)
+            resp = ""
+        text = self._response_to_text(resp)
+        print(f"***FlashcardAgent processed text: {text}")
+        return self._parse_cards(text)
+
+    def _parse_cards(self, text):
+        # try strict JSON parse first
+        try:
+            parsed = json.loads(text)
+            print(f"***FlashcardAgent parsed JSON: {parsed}")
+            if isinstance(parsed, list):
+                return parsed
+        except Exception:
+            pass
+
+        # salvage: find first JSON array in the output
+        m = re.search(r'(\[.*\])', text, re.S)
+        print(f"***FlashcardAgent regex search match: {m}")
+        if m:
             try:
-                parsed = json.loads(text)
-                print(f"***FlashcardAgent parsed JSON: {parsed}")
+                parsed = json.loads(m.group(1))
+                print(f"***FlashcardAgent salvaged parsed JSON: {parsed}")
                 if isinstance(parsed, list):
-                    out.extend(parsed)
-                    continue
+                    return parsed
             except Exception:
+                # final fallback: try to parse line-by-line Q: A:
                 pass
 
-            # salvage: find first JSON array in the output
-            m = re.search(r'(\[.*\])', text, re.S)
-            print(f"***FlashcardAgent regex search match: {m}")
-            if m:
-                try:
-                    parsed = json.loads(m.group(1))
-                    print(f"***FlashcardAgent salvaged parsed JSON: {parsed}")
-                    if isinstance(parsed, list):
-                        out.extend(parsed)
-                        continue
-                except Exception:
-                    # final fallback: try to parse line-by-line Q: A:
-                    pass
-
-            # fallback: naive line extraction as last resort
-            # split into QA pairs by lines containing '?' or 'Q:' / 'A:'
-            lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-            print(f"***FlashcardAgent fallback lines: {lines}")
-            qa = []
-            cur_q = None
-            for ln in lines:
-                if ln.endswith("?") and not cur_q:
-                    cur_q = ln
-                elif ln.lower().startswith("q:"):
-                    cur_q = ln[2:].strip()
-                elif ln.lower().startswith("a:") and cur_q:
-                    qa.append({"question": cur_q, "answer": ln[2:].strip()})
-                    cur_q = None
-            out.extend(qa)
-        return out
+        # fallback: naive line extraction as last resort
+        # split into QA pairs by lines containing '?' or 'Q:' / 'A:'
+        lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
+        print(f"***FlashcardAgent fallback lines: {lines}")
+        qa = []
+        cur_q = None
+        for ln in lines:
+            if ln.endswith("?") and not cur_q:
+                cur_q = ln
+            elif ln.lower().startswith("q:"):
+                cur_q = ln[2:].strip()
+            elif ln.lower().startswith("a:") and cur_q:
+                qa.append({"question": cur_q, "answer": ln[2:].strip()})
+                cur_q = None
+        return qa
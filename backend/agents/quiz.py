@@ -9,6 +9,16 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.google_llm import create_google_llm
+from utils.parallel import concurrency_for, map_ordered
+from utils.batching import (
+    batch_budget_for,
+    chunk_progress,
+    estimate_tokens,
+    format_packed_chunks,
+    pack_chunks,
+    parse_keyed_json,
+    resolve_batch_size,
+)
 
 QUIZ_PROMPT = """You are a quiz generator.
 Given the following text chunk, produce between 1 and 5 multiple-choice questions and return them as a valid JSON array.
@@ -41,15 +51,55 @@ Text to use for generating the quiz:
 Return strictly a JSON array.
 """
 
+QUIZ_BATCH_PROMPT = """You are a quiz generator.
+You are given several text chunks, each wrapped in <chunk id="N"> tags. For each chunk, produce between 1 and 5 multiple-choice questions drawn only from that chunk, and return them as a valid JSON object keyed by chunk id.
+
+Requirements:
+- Output must be a single valid JSON object.
+- Each key must be a chunk id (as a string) and each value a JSON array of questions for that chunk.
+- Include every chunk id. Use an empty array for a chunk with no suitable quiz.
+- Each question must have four keys: "question", "options", "answer", and "difficulty".
+- The "options" key must be an array of 4 strings.
+- The "answer" key must be one of the strings from the "options" array.
+- The "difficulty" must be a string: "Easy", "Medium", or "Hard".
+- Do NOT include any explanatory text, markdown, or code fences — output only the JSON object.
+- Escape any quotes or special characters so the JSON is valid.
+
+Example output:
+{{
+    "1": [
+        {{
+            "question": "What is the capital of France?",
+            "options": ["London", "Berlin", "Paris", "Madrid"],
+            "answer": "Paris",
+            "difficulty": "Easy"
+        }}
+    ],
+    "2": []
+}}
+
+Text chunks to use for generating the quiz:
+
+{chunks}
+
+
+Return strictly a JSON object.
+"""
+
 class QuizAgent:
-    def __init__(self, llm=None):
+    def __init__(self, llm=None, max_concurrency=None, batch_size=None):
         if llm is None:
             self.llm = create_google_llm()
             self.chain = None
+            self.batch_chain = None
         else:
             self.llm = llm
             prompt = PromptTemplate.from_template(QUIZ_PROMPT)
             self.chain = prompt | self.llm
+            self.batch_chain = PromptTemplate.from_template(QUIZ_BATCH_PROMPT) | self.llm
+        self.max_concurrency = max_concurrency or concurrency_for(self.llm)
+        # Chunks per prompt: an int, "auto" or None for GENERATION_BATCH_SIZE.
+        self.batch_size = batch_size
 
     def _response_to_text(self, resp):
         if resp is None:
@@ -69,45 +119,114 @@ class QuizAgent:
                 return str(resp)
         return str(resp)
 
-    def generate_from_chunks(self, chunks):
+    def generate_from_chunks(self, chunks, on_progress=None):
+        """
+        Generate quiz questions for every chunk, keeping the input order.
+
+        Chunks run concurrently up to self.max_concurrency and a failing chunk
+        contributes no questions. on_progress(done, total) is called as each
+        chunk finishes.
+        """
         print("***QuizAgent generating from chunks...")
-        out = []
-        for c in chunks:
-            print("***QuizAgent processing chunk...")
+        batch_size = resolve_batch_size(self.batch_size)
+        if batch_size != 1:
+            return self._generate_packed(chunks, batch_size, on_progress)
+        results = map_ordered(self._generate_one, chunks, self.max_concurrency, on_progress)
+        return [q for qs in results if qs for q in qs]
+
+    def _generate_packed(self, chunks, batch_size, on_progress=None):
+        """Generate questions with several chunks packed into each prompt."""
+        avg_tokens = sum(estimate_tokens(c) for c in chunks) // max(len(chunks), 1)
+        max_chunks, max_input = batch_budget_for(self.llm, avg_tokens)
+        if batch_size:
+            # A configured size caps the group; it never exceeds the model's budget.
+            max_chunks = min(max_chunks, batch_size)
+        groups = pack_chunks(chunks, max_chunks, max_input)
+        print(f"***QuizAgent packing {len(chunks)} chunks into {len(groups)} prompts")
+        report = chunk_progress(len(chunks), on_progress)
+
+        def run(group):
             try:
-                if self.chain is None:
-                    resp = self.llm.predict(QUIZ_PROMPT.replace("{chunk}", c))
-                else:
-                    result = self.chain.invoke({"chunk": c})
-                    resp = result.content if hasattr(result, 'content') else str(result)
-            except Exception as e:
-                print("***QuizAgent exception during prediction/invocation", e)
-                resp = ""
-            text = self._response_to_text(resp)
-            print(f"***QuizAgent processed text: {text}")
+                return self._generate_group([chunks[i] for i in group])
+            finally:
+                report(len(group))
+
+        results = map_ordered(run, groups, self.max_concurrency)
+        return [q for group_qs in results if group_qs for qs in group_qs for q in qs]
+
+    def _generate_group(self, group):
+        """
+        Return one list of questions per chunk in group, tagged with source_chunk.
+
+        Chunks the response leaves out are retried together; a response with
+        nothing usable is retried as two halves.
+        """
+        if len(group) == 1:
+            return [self._generate_one(group[0])]
+        packed = format_packed_chunks(group)
+        try:
+            if self.chain is None:
+                resp = self.llm.predict(QUIZ_BATCH_PROMPT.replace("{chunks}", packed))
+            else:
+                result = self.batch_chain.invoke({"chunks": packed})
+                resp = result.content if hasattr(result, 'content') else str(result)
+        except Exception as e:
+            print("***QuizAgent exception during packed invocation", e)
+            resp = ""
+        by_id = parse_keyed_json(self._response_to_text(resp)) or {}
+        missing = [c for i, c in enumerate(group, 1) if i not in by_id]
+        if len(missing) == len(group):
+            mid = len(group) // 2
+            return self._generate_group(group[:mid]) + self._generate_group(group[mid:])
+        retried = iter(self._generate_group(missing) if missing else [])
+        out = []
+        for i, c in enumerate(group, 1):
+            if i not in by_id:
+                out.append(next(retried))
+                continue
+            qs = [q for q in by_id[i] if isinstance(q, dict)]
+            for q in qs:
+                q['source_chunk'] = c
+            out.append(qs)
+        return out
+
+    def _generate_one(self, c):
+        print("***QuizAgent processing chunk...")
+        try:
+            if self.chain is None:
+                resp = self.llm.predict(QUIZ_PROMPT.replace("{chunk}", c))
+            else:
+                result = self.chain.invoke({"chunk": c})
+                resp = result.content if hasattr(result, 'content') else str(result)
+        except Exception as e:
+            print("***QuizAgent exception during prediction/invocation", e)
+            resp = ""
+        text = self._response_to_text(resp)
+        print(f"***QuizAgent processed text: {text}")
+        return self._parse_questions(text, c)
+
+    def _parse_questions(self, text, c):
+        try:
+            parsed = json.loads(text)
+            if isinstance(parsed, list):
+                for q in parsed:
+                    if isinstance(q, dict):
+                        q['source_chunk'] = c
+                return parsed
+        except Exception:
+            pass
+
+        m = re.search(r'(\[.*\])', text, re.S)
+        print(f"***QuizAgent regex search match: {m}")
+        if m:
             try:
-                parsed = json.loads(text)
+                parsed = json.loads(m.group(1))
                 if isinstance(parsed, list):
                     for q in parsed:
                         if isinstance(q, dict):
                             q['source_chunk'] = c
-                    out.extend(parsed)
-                    continue
+                    return parsed
             except Exception:
                 pass
 
-            m = re.search(r'(\[.*\])', text, re.S)
-            print(f"***QuizAgent regex search match: {m}")
-            if m:
-                try:
-                    parsed = json.loads(m.group(1))
-                    if isinstance(parsed, list):
-                        for q in parsed:
-                            if isinstance(q, dict):
-                                q['source_chunk'] = c
-                        out.extend(parsed)
-                        continue
-                except Exception:
-                    pass
-
-        return out
+        return []
@@ -1,9 +1,10 @@
 # reader.py
-from utils.pdf_utils import extract_text_from_file
+from utils.pdf_utils import iter_pages_from_file
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 class ReaderAgent:
     def __init__(self, chunk_size=1000, chunk_overlap=200):
+        self.chunk_size = chunk_size
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size, chunk_overlap=chunk_overlap
         )
@@ -13,10 +14,40 @@ class ReaderAgent:
         Read and process any supported file format (PDF, PPTX, DOCX, TXT, Images).
         Returns chunked text content.
         """
-        raw = extract_text_from_file(path)
-        cleaned = self.clean_text(raw)
-        chunks = self.splitter.split_text(cleaned)
-        return chunks
+        return [chunk["text"] for chunk in self.iter_chunks(path)]
+
+    def iter_chunks(self, path: str):
+        """
+        Stream chunks of any supported file as {"text", "page"} dicts.
+
+        Pages are extracted, cleaned and split one at a time, so memory stays
+        flat regardless of document length and callers can start embedding
+        before extraction finishes. Short pages (e.g. slides) are merged until
+        they would overflow a chunk; "page" is the first page a chunk's text
+        comes from.
+        """
+        return self.chunk_pages(iter_pages_from_file(path))
+
+    def chunk_pages(self, pages):
+        """Chunk already extracted (page_number, text) pairs; see iter_chunks."""
+        buffer, start_page, size = [], None, 0
+        for page, text in pages:
+            cleaned = self.clean_text(text)
+            if not cleaned.strip():
+                continue
+            if buffer and size + len(cleaned) > self.chunk_size:
+                yield from self._split_buffer(buffer, start_page)
+                buffer, size = [], 0
+            if not buffer:
+                start_page = page
+            buffer.append(cleaned)
+            size += len(cleaned)
+        if buffer:
+            yield from self._split_buffer(buffer, start_page)
+
+    def _split_buffer(self, buffer, page):
+        for chunk in self.splitter.split_text("\n".join(buffer)):
+            yield {"text": chunk, "page": page}
 
     def read_pdf(self, path: str):
         """Legacy method - redirects to read_file for backward compatibility."""
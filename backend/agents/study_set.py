@@ -0,0 +1,116 @@
+# study_set.py
+import json
+import re
+from langchain_core.prompts import PromptTemplate
+
+# Use absolute import for the utils module
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.parallel import map_ordered
+
+STUDY_SET_PROMPT = """You are a study material generator.
+Given the following text chunk, produce both flashcards and multiple-choice quiz questions, and return them as a single valid JSON object.
+
+Requirements:
+- Output must be a valid JSON object with exactly two keys: "flashcards" and "quizzes".
+- "flashcards" must be an array of between 1 and 6 objects with three keys: "question", "answer", and "explanation".
+- Keep flashcard questions concise (<= 120 characters) and answers concise (<= 400 characters).
+- "quizzes" must be an array of between 1 and 5 objects with four keys: "question", "options", "answer", and "difficulty".
+- Each quiz "options" must be an array of 4 strings, and "answer" must be one of those strings.
+- Each quiz "difficulty" must be a string: "Easy", "Medium", or "Hard".
+- Do NOT include any explanatory text, markdown, or code fences — output only the JSON object.
+- If nothing suitable can be produced, use empty arrays.
+- Escape any quotes or special characters so the JSON is valid.
+
+Example output:
+{{
+    "flashcards": [
+        {{
+            "question": "What is the capital of France?",
+            "answer": "Paris",
+            "explanation": "Paris is the capital and most populous city of France."
+        }}
+    ],
+    "quizzes": [
+        {{
+            "question": "Which city is the capital of France?",
+            "options": ["London", "Berlin", "Paris", "Madrid"],
+            "answer": "Paris",
+            "difficulty": "Easy"
+        }}
+    ]
+}}
+
+Text to use for generating flashcards and quizzes:
+
+{chunk}
+
+
+Return strictly a JSON object.
+"""
+
+class StudySetAgent:
+    """
+    Generates flashcards and quiz questions for a chunk in a single LLM call.
+
+    Output matches FlashcardAgent and QuizAgent, so results can be written to
+    flashcards.json and quizzes.json unchanged. A chunk whose combined
+    response cannot be parsed falls back to the two separate agents.
+    """
+
+    def __init__(self, flash_agent, quiz_agent, max_concurrency=None):
+        self.flash_agent = flash_agent
+        self.quiz_agent = quiz_agent
+        self.llm = flash_agent.llm
+        self.chain = PromptTemplate.from_template(STUDY_SET_PROMPT) | self.llm
+        self.max_concurrency = max_concurrency or flash_agent.max_concurrency
+
+    def generate_from_chunks(self, chunks, on_progress=None):
+        """
+        Generate flashcards and quizzes for every chunk.
+
+        Returns a (flashcards, quizzes) tuple, each in chunk order.
+        """
+        print("***StudySetAgent generating from chunks...")
+        results = map_ordered(self._generate_one, chunks, self.max_concurrency, on_progress)
+        flashcards, quizzes = [], []
+        for result in results:
+            if result:
+                flashcards.extend(result[0])
+                quizzes.extend(result[1])
+        return flashcards, quizzes
+
+    def _generate_one(self, c):
+        print("***StudySetAgent processing chunk...")
+        try:
+            result = self.chain.invoke({"chunk": c})
+            resp = result.content if hasattr(result, 'content') else str(result)
+        except Exception as e:
+            print("***StudySetAgent exception during invocation", e)
+            resp = ""
+        parsed = self._parse(self.flash_agent._response_to_text(resp))
+        if parsed is None:
+            print("***StudySetAgent falling back to separate generation")
+            return self.flash_agent._generate_one(c), self.quiz_agent._generate_one(c)
+
+        flashcards = [f for f in parsed.get("flashcards") or [] if isinstance(f, dict)]
+        quizzes = [q for q in parsed.get("quizzes") or [] if isinstance(q, dict)]
+        for q in quizzes:
+            q['source_chunk'] = c
+        return flashcards, quizzes
+
+    def _parse(self, text):
+        try:
+            parsed = json.loads(text)
+        except Exception:
+            m = re.search(r'(\{.*\})', text, re.S)
+            if not m:
+                return None
+            try:
+                parsed = json.loads(m.group(1))
+            except Exception:
+                return None
+        if not isinstance(parsed, dict) or not ({"flashcards", "quizzes"} & parsed.keys()):
+            return None
+        return parsed
@@ -2,6 +2,7 @@
 import os
 import json
 import asyncio
+from typing import List
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -11,12 +12,25 @@ from agents.flashcard import FlashcardAgent
 from agents.quiz import QuizAgent
 from agents.planner import PlannerAgent
 from agents.chat_agent import ChatAgent
+from agents.study_set import StudySetAgent
+from utils.index_manager import IndexManager
+from utils.answer_cache import create_answer_cache
+from utils.embedding_cache import CachedEmbeddings, create_embedding_cache
+from utils.embedding_executor import create_batched_embeddings
+from utils.llm_cache import bypass_llm_cache, create_llm_cache
+from utils.llm_router import create_router_llm
+from utils.rate_limiter import BULK, llm_priority
+from utils.pdf_utils import shutdown_extraction_pool
+from utils.upload_store import UploadTooLarge, create_upload_store
+from utils.jobs import JobQueue, QueueFull
+from utils.ingest_pipeline import IngestPipeline
+from utils.hybrid_retriever import RETRIEVAL_FETCH_K, HybridRetriever
+from utils.context_builder import CHAT_CANDIDATES
 
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_core.documents import Document
 from langchain_community.embeddings import OllamaEmbeddings
+from langchain_core.globals import set_llm_cache
 
 from dotenv import load_dotenv
 
@@ -39,16 +53,20 @@ OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "mistral")
 
 FAISS_INDEX_PATH = os.environ.get("FAISS_INDEX_PATH", "./outputs/faiss_index")
+# "hybrid" fuses dense and BM25 keyword results; "dense" uses FAISS only.
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
 
 # --- LLM and Embeddings Initialization (Ollama first) ---
-llm = None
+# Every provider that initializes is kept; calls are routed between them at
+# runtime. Embeddings come from the first (preferred) provider.
+providers = []
 embeddings = None
 active_provider = "None"
 
 # Tier 1: Ollama
 try:
     from utils.ollama_llm import create_ollama_llm
-    llm = create_ollama_llm(model=OLLAMA_MODEL)
+    providers.append(("Ollama", create_ollama_llm(model=OLLAMA_MODEL)))
     embeddings = OllamaEmbeddings(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL)
     active_provider = "Ollama"
     print("✅ Using Ollama as primary LLM provider.")
@@ -56,37 +74,73 @@ except Exception as e:
     print(f"Ollama initialization failed: {e}. Falling back...")
 
 # Tier 2: Google Gemini
-if not llm and GOOGLE_API_KEY:
+if GOOGLE_API_KEY:
     try:
         from utils.google_llm import create_google_llm
-        llm = create_google_llm(api_key=GOOGLE_API_KEY)
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=GOOGLE_API_KEY)
-        active_provider = "Google Gemini"
-        print("✅ Using Google Gemini as fallback LLM provider.")
+        providers.append(("Google Gemini", create_google_llm(api_key=GOOGLE_API_KEY)))
+        if embeddings is None:
+            embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=GOOGLE_API_KEY)
+            active_provider = "Google Gemini"
+        print("✅ Google Gemini available as fallback LLM provider.")
     except Exception as e:
         print(f"Google Gemini initialization failed: {e}. Falling back...")
 
 # Tier 3: OpenAI
-if not llm and OPENAI_API_KEY:
+if OPENAI_API_KEY:
     try:
-        llm = ChatOpenAI(model_name=os.environ.get("LLM_MODEL", "gpt-4o-mini"), temperature=0.1, api_key=OPENAI_API_KEY)
-        embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
-        active_provider = "OpenAI"
-        print("✅ Using OpenAI as final fallback LLM provider.")
+        providers.append(("OpenAI", ChatOpenAI(model_name=os.environ.get("LLM_MODEL", "gpt-4o-mini"), temperature=0.1, api_key=OPENAI_API_KEY)))
+        if embeddings is None:
+            embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
+            active_provider = "OpenAI"
+        print("✅ OpenAI available as final fallback LLM provider.")
     except Exception as e:
         print(f"OpenAI initialization failed: {e}")
 
-if not llm:
+if not providers:
     raise RuntimeError("FATAL: All LLM providers failed to initialize. Please check your configurations.")
 
+# Health-checked routing with circuit breakers across all initialized providers.
+llm = create_router_llm(providers)
+
 print(f"\n🎯 Active LLM Provider: {active_provider}\n")
 
+# Chunks are embedded in concurrent, adaptively sized batches.
+batched_embeddings = create_batched_embeddings(embeddings, provider=active_provider)
+# An index that does not record its embeddings predates the batched Ollama
+# endpoint; keep embedding the way it was built so its vectors stay comparable.
+manifest = IndexManager.current_manifest(FAISS_INDEX_PATH)
+if manifest is not None and not manifest.get("embedding_model"):
+    batched_embeddings.use_legacy_endpoint()
+
+# Re-uploaded or overlapping material is embedded only once per provider/model.
+embedding_cache = create_embedding_cache()
+embeddings = CachedEmbeddings(batched_embeddings, embedding_cache, provider=active_provider, model=batched_embeddings.model)
+
+# Identical prompts to the same model and settings are answered from disk.
+llm_cache = None
+if os.environ.get("LLM_CACHE_DISABLED", "").lower() not in ("1", "true", "yes"):
+    llm_cache = create_llm_cache()
+    set_llm_cache(llm_cache)
+
+# Repeated (or near-identical) chat questions are answered without retrieval or generation.
+answer_cache = None
+if os.environ.get("ANSWER_CACHE_DISABLED", "").lower() not in ("1", "true", "yes"):
+    answer_cache = create_answer_cache(embeddings)
+
 # --- Agent Instantiation ---
 reader = ReaderAgent()
 flash_agent = FlashcardAgent(llm=llm)
 quiz_agent = QuizAgent(llm=llm)
+study_set_agent = StudySetAgent(flash_agent, quiz_agent)
 planner_agent = PlannerAgent()
 chat_agent = ChatAgent(faiss_index_path=FAISS_INDEX_PATH, llm=llm, embeddings=embeddings)
+index_manager = IndexManager(FAISS_INDEX_PATH, embeddings, embedding_model=embeddings.namespace)
+upload_store = create_upload_store()
+ingest_pipeline = IngestPipeline(index_manager, reader)
+job_queue = JobQueue(
+    workers=int(os.environ.get("INGEST_WORKERS", "2")),
+    max_queued=int(os.environ.get("INGEST_QUEUE_SIZE", "32")),
+)
 
 # --- In-Memory Stores and Helpers ---
 accuracy_store = {}
@@ -96,39 +150,203 @@ def store_json(obj, path):
     with open(path, "w", encoding="utf-8") as f:
         json.dump(obj, f, ensure_ascii=False, indent=2)
 
+async def run_with_progress(generate, chunks, results, label, start, end):
+    """
+    Run a blocking generate_from_chunks in a worker thread and yield SSE
+    progress events as chunks complete. The return value is appended to results.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    def on_progress(done, total):
+        loop.call_soon_threadsafe(queue.put_nowait, (done, total))
+    task = asyncio.ensure_future(asyncio.to_thread(generate, chunks, on_progress=on_progress))
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    while (item := await queue.get()) is not None:
+        done, total = item
+        progress = start + (end - start) * done // max(total, 1)
+        yield f"data: {json.dumps({'message': f'{label} ({done}/{total})...', 'progress': progress})}\n\n"
+    results.append(task.result())
+
+def build_retriever():
+    """
+    Return (retriever, index version) for the current index version, or
+    (None, None) if there is no index.
+    """
+    db, bm25, version = index_manager.snapshot()
+    if db is None:
+        return None, None
+    # Over-fetch: ChatAgent's context builder dedupes, reranks and trims to budget.
+    if RETRIEVAL_MODE == "dense":
+        return db.as_retriever(search_kwargs={"k": CHAT_CANDIDATES}), version
+    return HybridRetriever(
+        db=db, bm25=bm25, k=CHAT_CANDIDATES, fetch_k=max(RETRIEVAL_FETCH_K, CHAT_CANDIDATES)
+    ), version
+
+@app.on_event("startup")
+async def startup():
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_queue.stop()
+    shutdown_extraction_pool()
+    llm.close()
+    if any(name == "Ollama" for name, _ in providers):
+        from utils.ollama_llm import aclose_async_clients
+        await aclose_async_clients()
+
 # --- API Endpoints ---
 @app.post("/upload_pdf")
 async def upload_pdf(file: UploadFile = File(...)):
-    tmp_path = f"./outputs/{file.filename}"
-    with open(tmp_path, "wb") as f:
-        f.write(await file.read())
-    
-    chunks = reader.read_file(tmp_path)
-    db = FAISS.from_documents([Document(page_content=c) for c in chunks], embeddings)
-    db.save_local(FAISS_INDEX_PATH)
-    store_json({"chunks_count": len(chunks)}, "./outputs/reader_summary.json")
-    return {"status": "ok"}
+    try:
+        path, digest, _ = await upload_store.save(file)
+    except UploadTooLarge as e:
+        raise HTTPException(413, str(e))
+
+    # Identical content is already embedded; skip extraction and embedding.
+    existing = index_manager.find_by_hash(digest)
+    if existing:
+        return {"status": "ok", "source": existing, "sha256": digest, "skipped": True}
+
+    source = file.filename
+
+    def ingest(job):
+        job.report("reading", 5)
+        def on_progress(stage, chunks):
+            job.report(stage, 90 if stage == "indexing" else None, chunks=chunks)
+        # Chunks stream from the reader straight into embedding, page by page.
+        chunks_count = index_manager.add_document(source, reader.iter_chunks(path), content_hash=digest, on_progress=on_progress)
+        store_json({"chunks_count": chunks_count}, "./outputs/reader_summary.json")
+        return {"source": source, "chunks": chunks_count}
+
+    try:
+        job = job_queue.submit("ingest", ingest, source=source, sha256=digest)
+    except QueueFull as e:
+        raise HTTPException(503, str(e))
+    return JSONResponse({"status": "queued", "job_id": job.id, "source": source, "sha256": digest}, status_code=202)
+
+@app.post("/upload_batch")
+async def upload_batch(files: List[UploadFile] = File(...)):
+    batch, skipped, seen = [], [], {}
+    for file in files:
+        try:
+            path, digest, _ = await upload_store.save(file)
+        except UploadTooLarge as e:
+            skipped.append({"source": file.filename, "status": "failed", "error": str(e)})
+            continue
+        existing = index_manager.find_by_hash(digest) or seen.get(digest)
+        if existing:
+            skipped.append({"source": file.filename, "status": "skipped", "duplicate_of": existing})
+            continue
+        seen[digest] = file.filename
+        batch.append({"source": file.filename, "path": path, "sha256": digest})
+
+    if not batch:
+        return {"status": "ok", "files": skipped}
+
+    def ingest(job):
+        def on_progress(stage, files_done, chunks):
+            progress = 95 if stage == "indexing" else 5 + 85 * files_done // len(batch)
+            job.report(stage, progress, files_done=files_done, files=len(batch), chunks=chunks)
+        job.report("reading", 5, files_done=0, files=len(batch), chunks=0)
+        result = ingest_pipeline.run(batch, on_progress=on_progress)
+        result["files"] += skipped
+        store_json({"chunks_count": result["chunks"]}, "./outputs/reader_summary.json")
+        return result
+
+    try:
+        job = job_queue.submit("ingest_batch", ingest, files=len(batch))
+    except QueueFull as e:
+        raise HTTPException(503, str(e))
+    return JSONResponse({"status": "queued", "job_id": job.id, "files": [f["source"] for f in batch], "skipped": skipped}, status_code=202)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None: raise HTTPException(404, "Job not found.")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None: raise HTTPException(404, "Job not found.")
+    async def generator():
+        async for event in job_queue.events(job):
+            yield f"data: {json.dumps(event)}\n\n"
+    return StreamingResponse(generator(), media_type="text/event-stream")
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None: raise HTTPException(404, "Job not found.")
+    if not job.cancel(): raise HTTPException(409, f"Job already {job.status}.")
+    return {"status": "cancelling", "job_id": job.id}
+
+@app.get("/documents")
+async def list_documents():
+    return index_manager.documents()
+
+@app.delete("/documents/{source}")
+async def delete_document(source: str):
+    removed = index_manager.delete_document(source)
+    if not removed: raise HTTPException(404, "Document not found.")
+    return {"status": "ok", "removed_chunks": removed}
+
+@app.post("/index/compact")
+async def compact_index():
+    return {"status": "ok", "vectors": index_manager.compact()}
+
+@app.get("/index/recall")
+async def index_recall(k: int = 10, queries: int = 200):
+    report = await asyncio.to_thread(index_manager.recall_report, k, queries)
+    if report is None: raise HTTPException(400, "Index not found.")
+    return report
 
 @app.get("/generate_all")
-async def generate_all():
+async def generate_all(refresh: bool = False, mode: str = os.environ.get("GENERATION_MODE", "separate")):
     async def generator():
-        if not os.path.exists(FAISS_INDEX_PATH):
+        # Bulk generation queues behind interactive chat for LLM capacity.
+        with llm_priority(BULK):
+            if refresh:
+                # Regenerate everything from the LLM, refreshing cached responses.
+                with bypass_llm_cache():
+                    async for event in generate():
+                        yield event
+            else:
+                async for event in generate():
+                    yield event
+
+    async def generate():
+        if not index_manager.exists():
             yield f"data: {json.dumps({'error': 'No materials uploaded.'})}\n\n"
             return
         
-        db = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-        chunks = [d.page_content for d in db.docstore._dict.values()]
+        chunks = index_manager.texts()
 
-        yield f"data: {json.dumps({'message': 'Generating flashcards...', 'progress': 10})}\n\n"
-        await asyncio.sleep(0.1)
-        flashcards = flash_agent.generate_from_chunks(chunks)
-        store_json(flashcards, "./outputs/flashcards.json")
-        
-        yield f"data: {json.dumps({'message': 'Generating quizzes...', 'progress': 50})}\n\n"
-        await asyncio.sleep(0.1)
         difficult_chunks = [c for c, s in accuracy_store.items() if s["incorrect"] > s["correct"]]
-        quizzes = quiz_agent.generate_from_chunks(chunks + difficult_chunks)
-        store_json(quizzes, "./outputs/quizzes.json")
+        out = []
+        if mode == "combined":
+            # One prompt per chunk yields both flashcards and quizzes.
+            yield f"data: {json.dumps({'message': 'Generating flashcards and quizzes...', 'progress': 10})}\n\n"
+            async for event in run_with_progress(study_set_agent.generate_from_chunks, chunks, out, "Generating flashcards and quizzes", 10, 80):
+                yield event
+            flashcards, quizzes = out.pop()
+            if difficult_chunks:
+                async for event in run_with_progress(quiz_agent.generate_from_chunks, difficult_chunks, out, "Generating extra quizzes", 80, 90):
+                    yield event
+                quizzes += out.pop()
+            store_json(flashcards, "./outputs/flashcards.json")
+            store_json(quizzes, "./outputs/quizzes.json")
+        else:
+            yield f"data: {json.dumps({'message': 'Generating flashcards...', 'progress': 10})}\n\n"
+            async for event in run_with_progress(flash_agent.generate_from_chunks, chunks, out, "Generating flashcards", 10, 50):
+                yield event
+            store_json(out.pop(), "./outputs/flashcards.json")
+            
+            yield f"data: {json.dumps({'message': 'Generating quizzes...', 'progress': 50})}\n\n"
+            async for event in run_with_progress(quiz_agent.generate_from_chunks, chunks + difficult_chunks, out, "Generating quizzes", 50, 90):
+                yield event
+            store_json(out.pop(), "./outputs/quizzes.json")
 
         yield f"data: {json.dumps({'message': 'Creating study plan...', 'progress': 90})}\n\n"
         await asyncio.sleep(0.1)
@@ -167,12 +385,26 @@ class ChatRequest(BaseModel):
 
 @app.post("/chat")
 async def chat(req: ChatRequest):
-    if not os.path.exists(FAISS_INDEX_PATH): raise HTTPException(400, "Index not found.")
-    db = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-    retriever = db.as_retriever()
-    chain = chat_agent.build_chain(retriever)
-    res = chain({"question": req.question, "chat_history": req.chat_history})
-    return {"answer": res.get("answer"), "sources": [d.page_content for d in res.get("source_documents", [])]}
+    retriever, version = build_retriever()
+    if retriever is None: raise HTTPException(400, "Index not found.")
+    chain = chat_agent.build_chain(retriever, answer_cache=answer_cache, index_version=version)
+    res = await chain.acall(req.question, req.chat_history)
+    return {"answer": res.get("answer"), "sources": [d.page_content for d in res.get("source_documents", [])], "cached": res.get("cached", False)}
+
+@app.post("/chat_stream")
+async def chat_stream(req: ChatRequest):
+    retriever, version = build_retriever()
+    if retriever is None: raise HTTPException(400, "Index not found.")
+    chain = chat_agent.build_chain(retriever, answer_cache=answer_cache, index_version=version)
+
+    async def generator():
+        try:
+            async for event in chain.astream(req.question, req.chat_history):
+                yield f"data: {json.dumps(event)}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+
+    return StreamingResponse(generator(), media_type="text/event-stream")
 
 class AnswerRequest(BaseModel):
     source_chunk: str
@@ -187,3 +419,17 @@ async def submit_answer(req: AnswerRequest):
 
 @app.get("/health")
 def health(): return {"status": "ok"}
+
+@app.get("/status")
+def status():
+    return {
+        "provider": active_provider,
+        "llm": llm.stats(),
+        "index": index_manager.status(),
+        "embeddings": batched_embeddings.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "llm_cache": llm_cache.stats() if llm_cache else None,
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "chat_history": chat_agent.history.stats(),
+        "jobs": job_queue.stats(),
+    }
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def history_key(chat_history) -> str:
+    """
+    Hash a chat history so that equivalent histories share a key.
+
+    Case, surrounding punctuation and whitespace are ignored; an empty
+    history hashes to "".
+    """
+    if not chat_history:
+        return ""
+    turns = [[re.sub(r"\s+", " ", str(part)).strip().strip("?!.").lower() for part in turn] for turn in chat_history]
+    return hashlib.sha256(json.dumps(turns).encode("utf-8")).hexdigest()
+
+
+def _version_order(version: Optional[str]) -> int:
+    """
+    Sort key for index versions ("v<time_ns>", see IndexManager); later
+    versions sort higher and no version sorts first.
+    """
+    if not version:
+        return -1
+    try:
+        return int(version.lstrip("v"))
+    except ValueError:
+        return -1
+
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of chat answers, matched by question similarity.
+
+    A question is embedded and compared (cosine similarity) with previously
+    answered questions asked against the same index version and an
+    equivalent chat history; the best match at or above threshold is a hit.
+    Entries from older index versions are dropped as soon as a newer version
+    is seen, and the least recently used entries are evicted beyond
+    max_entries. A request still working from an older version (one that
+    started before an upload was committed) is a miss and stores nothing.
+    """
+
+    def __init__(self, embeddings: Embeddings, threshold: float = 0.95, max_entries: int = 1000):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _check_version(self, version: str) -> bool:
+        """
+        Drop every entry once the index has moved to a newer version.
+        Caller holds the lock.
+
+        Returns:
+            False if version is older than the one the cache holds
+        """
+        if version == self._version:
+            return True
+        if _version_order(version) < _version_order(self._version):
+            return False
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._version = version
+        return True
+
+    def lookup(self, question: str, version: str, chat_history=None) -> Optional[dict]:
+        """
+        Return a cached {"answer", "sources", "question", "similarity"} or None.
+
+        Args:
+            question: The user's question
+            version: Index version the answer must have been produced from
+            chat_history: List of (question, answer) tuples preceding it
+        """
+        vector = self._embed(question)
+        key = history_key(chat_history)
+        with self._lock:
+            if not self._check_version(version):
+                self.misses += 1
+                return None
+            candidates = [(entry_id, e) for entry_id, e in self._entries.items() if e["history"] == key]
+            if candidates:
+                similarities = np.stack([e["vector"] for _, e in candidates]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return {
+                        "answer": entry["answer"],
+                        "sources": entry["sources"],
+                        "question": entry["question"],
+                        "similarity": round(float(similarities[best]), 4),
+                    }
+            self.misses += 1
+        return None
+
+    def store(self, question: str, version: str, chat_history, answer: str, sources: List[str]) -> None:
+        if not answer:
+            return
+        vector = self._embed(question)
+        with self._lock:
+            if not self._check_version(version):
+                return
+            entry_id = (history_key(chat_history), question)
+            self._entries[entry_id] = {
+                "history": entry_id[0],
+                "question": question,
+                "vector": vector,
+                "answer": answer,
+                "sources": sources,
+                "created": time.time(),
+            }
+            self._entries.move_to_end(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "index_version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_answer_cache(embeddings: Embeddings) -> SemanticAnswerCache:
+    """
+    Factory function to create the chat answer cache from the environment.
+
+    Honours ANSWER_CACHE_THRESHOLD (cosine similarity, default 0.95) and
+    ANSWER_CACHE_MAX_ENTRIES.
+    """
+    return SemanticAnswerCache(
+        embeddings,
+        threshold=float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95")),
+        max_entries=int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+    )
@@ -0,0 +1,170 @@
+import json
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+# Context window (input + output tokens) by model name prefix.
+CONTEXT_WINDOWS = {
+    "gemini-2.5": 1_048_576,
+    "gemini-2.0": 1_048_576,
+    "gemini-1.5": 1_048_576,
+    "gpt-4o": 128_000,
+    "gpt-4.1": 1_047_576,
+    "gpt-3.5-turbo": 16_385,
+    "mistral": 32_768,
+    "llama3": 8_192,
+    "llama2": 4_096,
+}
+
+# Ollama truncates prompts to its num_ctx (2048 by default on older servers,
+# 4096 on newer ones) regardless of what the model itself supports.
+OLLAMA_DEFAULT_CONTEXT = 4_096
+
+# Rough number of output tokens one chunk's flashcards or questions take.
+OUTPUT_TOKENS_PER_CHUNK = 400
+
+# Tokens reserved for the instructions that wrap the packed chunks.
+PROMPT_OVERHEAD_TOKENS = 600
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap, provider-agnostic token estimate (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def _model_name(llm) -> str:
+    return str(getattr(llm, "model", None) or getattr(llm, "model_name", None) or "")
+
+
+def context_window_for(llm) -> int:
+    """
+    Return the usable context window of an LLM, honouring LLM_CONTEXT_WINDOW.
+
+    For a RouterLLM this is the smallest window among its providers, since
+    any of them may end up serving the prompt.
+    """
+    override = os.environ.get("LLM_CONTEXT_WINDOW")
+    if override:
+        return int(override)
+    providers = getattr(llm, "providers", None)
+    if providers:
+        return min(context_window_for(p) for p in providers)
+    if getattr(llm, "_llm_type", "") == "ollama":
+        return OLLAMA_DEFAULT_CONTEXT
+    name = _model_name(llm)
+    for prefix, window in CONTEXT_WINDOWS.items():
+        if name.startswith(prefix):
+            return window
+    return OLLAMA_DEFAULT_CONTEXT
+
+
+def output_limit_for(llm) -> int:
+    """Return the most tokens the LLM is configured to generate per call."""
+    providers = getattr(llm, "providers", None)
+    if providers:
+        return min(output_limit_for(p) for p in providers)
+    for attr in ("num_predict", "max_output_tokens", "max_tokens"):
+        value = getattr(llm, attr, None)
+        if value:
+            return int(value)
+    return 2_048
+
+
+def batch_budget_for(llm, chunk_tokens: int) -> tuple:
+    """
+    Work out how many chunks fit in one call for this LLM.
+
+    Returns (max_chunks, max_input_tokens). The output limit usually binds
+    first, since every packed chunk adds its own flashcards or questions to
+    the response.
+    """
+    output_limit = output_limit_for(llm)
+    window = context_window_for(llm)
+    max_input = max(window - output_limit - PROMPT_OVERHEAD_TOKENS, chunk_tokens)
+    by_output = output_limit // OUTPUT_TOKENS_PER_CHUNK
+    by_input = max_input // max(chunk_tokens, 1)
+    return max(1, min(by_output, by_input)), max_input
+
+
+def resolve_batch_size(batch_size=None) -> Optional[int]:
+    """
+    Normalize a batch size setting.
+
+    Accepts an int, "auto" or None (read GENERATION_BATCH_SIZE). Returns None
+    for "auto" and an int otherwise; 1 means one chunk per call.
+    """
+    value = batch_size if batch_size is not None else os.environ.get("GENERATION_BATCH_SIZE", "1")
+    if str(value).lower() == "auto":
+        return None
+    return max(1, int(value))
+
+
+def pack_chunks(chunks: Sequence[str], max_chunks: int, max_input_tokens: int) -> List[List[int]]:
+    """
+    Greedily group chunk indices so each group stays within both limits.
+
+    Order is preserved, and a chunk that exceeds the token budget on its own
+    still gets a group of its own.
+    """
+    groups, current, tokens = [], [], 0
+    for i, chunk in enumerate(chunks):
+        cost = estimate_tokens(chunk)
+        if current and (len(current) >= max_chunks or tokens + cost > max_input_tokens):
+            groups.append(current)
+            current, tokens = [], 0
+        current.append(i)
+        tokens += cost
+    if current:
+        groups.append(current)
+    return groups
+
+
+def chunk_progress(total: int, on_progress: Optional[Callable[[int, int], None]]) -> Callable[[int], None]:
+    """
+    Return a thread-safe report(n) that adds n finished chunks and calls
+    on_progress(done, total), so packed prompts still report progress in chunks.
+    """
+    lock = threading.Lock()
+    done = 0
+
+    def report(n: int) -> None:
+        nonlocal done
+        with lock:
+            done += n
+            if on_progress:
+                on_progress(done, total)
+
+    return report
+
+
+def format_packed_chunks(chunks: Sequence[str]) -> str:
+    """Render chunks with 1-based ids for a packed prompt."""
+    return "\n\n".join(f'<chunk id="{i}">\n{c}\n</chunk>' for i, c in enumerate(chunks, 1))
+
+
+def parse_keyed_json(text: str) -> Optional[Dict[int, list]]:
+    """
+    Parse a {"<chunk id>": [...]} response from a packed prompt.
+
+    Returns a mapping of 1-based chunk id to its list of items, or None if
+    no JSON object can be recovered.
+    """
+    parsed = None
+    try:
+        parsed = json.loads(text)
+    except Exception:
+        m = re.search(r'(\{.*\})', text, re.S)
+        if m:
+            try:
+                parsed = json.loads(m.group(1))
+            except Exception:
+                parsed = None
+    if not isinstance(parsed, dict):
+        return None
+    out = {}
+    for key, items in parsed.items():
+        digits = re.sub(r"\D", "", str(key))
+        if digits and isinstance(items, list):
+            out[int(digits)] = items
+    return out
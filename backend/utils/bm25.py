@@ -0,0 +1,156 @@
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+# Words, numbers and joined codes such as "CS-101", "x86_64" or "3.14".
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the "
+    "this to was were what when where which who why will with how do does".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase and split text into index terms.
+
+    Joined tokens are kept whole and also split into their parts, so a query
+    for "CS-101" matches exactly while "CS 101" still matches both parts.
+    """
+    terms = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        parts = re.split(r"[._\-/]", token)
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p and p not in STOPWORDS)
+    return terms
+
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring.
+
+    Postings are keyed by chunk id, so chunks can be added and removed
+    incrementally as documents are uploaded or deleted. positions maps each
+    chunk id to its position in the FAISS index version the postings were
+    saved with, which is how search hits are resolved to documents.
+    """
+
+    FILE = "bm25.json"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self.positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def copy(self) -> "BM25Index":
+        """Return an independent copy, so readers of this one are not disturbed."""
+        other = BM25Index(self.k1, self.b)
+        other.postings = {term: dict(p) for term, p in self.postings.items()}
+        other.lengths = dict(self.lengths)
+        other.total_length = self.total_length
+        other.positions = dict(self.positions)
+        return other
+
+    def add(self, chunk_id: str, text: str) -> None:
+        if chunk_id in self.lengths:
+            self.remove(chunk_id, text)
+        terms = tokenize(text)
+        for term, tf in Counter(terms).items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+        self.lengths[chunk_id] = len(terms)
+        self.total_length += len(terms)
+
+    def remove(self, chunk_id: str, text: str) -> None:
+        """Remove a chunk; text must be the text it was added with."""
+        length = self.lengths.pop(chunk_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        self.positions.pop(chunk_id, None)
+        for term in set(tokenize(text)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(chunk_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Return up to k (chunk_id, score) pairs, best first."""
+        n = len(self.lengths)
+        if not n:
+            return []
+        avg_length = self.total_length / n or 1.0
+        scores = Counter()
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for chunk_id, tf in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / avg_length)
+                scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    @classmethod
+    def build(cls, chunks: Iterable[Tuple[str, str]]) -> "BM25Index":
+        """Build an index from (chunk_id, text) pairs in position order."""
+        index = cls()
+        for position, (chunk_id, text) in enumerate(chunks):
+            index.add(chunk_id, text)
+            index.positions[chunk_id] = position
+        return index
+
+    def save(self, directory: str, ids: List[str]) -> None:
+        """
+        Write the index next to an index version whose positions hold ids.
+
+        Postings are stored against positions rather than chunk ids to keep
+        the file compact.
+        """
+        self.positions = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "ids": ids,
+            "lengths": [self.lengths.get(chunk_id, 0) for chunk_id in ids],
+            "postings": {
+                term: [[self.positions[c], tf] for c, tf in posting.items() if c in self.positions]
+                for term, posting in self.postings.items()
+            },
+        }
+        tmp_path = os.path.join(directory, f"{self.FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, os.path.join(directory, self.FILE))
+
+    @classmethod
+    def load(cls, directory: str) -> "BM25Index":
+        """
+        Raises:
+            FileNotFoundError: If the version has no saved BM25 index
+        """
+        with open(os.path.join(directory, cls.FILE), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(data["k1"], data["b"])
+        ids = data["ids"]
+        index.positions = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        index.lengths = dict(zip(ids, data["lengths"]))
+        index.total_length = sum(data["lengths"])
+        index.postings = {
+            term: {ids[position]: tf for position, tf in posting}
+            for term, posting in data["postings"].items()
+        }
+        return index
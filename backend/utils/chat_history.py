@@ -0,0 +1,174 @@
+import contextvars
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+from utils.rate_limiter import BACKGROUND, llm_priority
+
+# Most recent turns replayed verbatim; older turns are folded into a summary.
+CHAT_HISTORY_TURNS = int(os.environ.get("CHAT_HISTORY_TURNS", "4"))
+# Target length of the rolling summary, in words.
+CHAT_SUMMARY_WORDS = int(os.environ.get("CHAT_SUMMARY_WORDS", "150"))
+# Conversations whose summaries are kept in memory.
+CHAT_SUMMARY_CACHE_SIZE = int(os.environ.get("CHAT_SUMMARY_CACHE_SIZE", "256"))
+
+SUMMARY_PROMPT = """You maintain a running summary of a study conversation between a student and an assistant.
+
+Current summary:
+{summary}
+
+New exchanges to fold in:
+{turns}
+
+Rewrite the summary so it also covers the new exchanges. Keep the topics, facts and open questions the student may refer back to. Use at most {words} words. Return only the summary."""
+
+Turn = Tuple[str, str]
+
+
+def _turn_digest(previous: str, turn: Sequence[str]) -> str:
+    """Chain a turn onto the digest of the turns before it."""
+    payload = previous + json.dumps([str(part) for part in turn], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _prefix_digests(turns: Sequence[Turn]) -> List[str]:
+    """digests[i] identifies turns[:i]; digests[0] is the empty history."""
+    digests = [""]
+    for turn in turns:
+        digests.append(_turn_digest(digests[-1], turn))
+    return digests
+
+
+def _format_turns(turns: Sequence[Turn]) -> str:
+    return "\n".join(f"Student: {q}\nAssistant: {a}" for q, a in turns)
+
+
+class HistoryManager:
+    """
+    Keep chat prompts a constant size however long a conversation runs.
+
+    The last keep_turns turns are replayed verbatim. Older turns are folded
+    into a rolling summary, which is cached by the digest of the turns it
+    covers. Clients resend the whole history with every request, so finding
+    the summary is a digest lookup, and updating it happens on a background
+    thread once an answer has been produced: the request that first needs
+    a fresher summary uses the newest cached one plus the few turns it does
+    not cover yet, rather than waiting on an extra LLM call.
+    """
+
+    def __init__(self, llm, keep_turns: int = CHAT_HISTORY_TURNS, summary_words: int = CHAT_SUMMARY_WORDS,
+                 cache_size: int = CHAT_SUMMARY_CACHE_SIZE):
+        self.llm = llm
+        self.keep_turns = max(0, keep_turns)
+        self.summary_words = summary_words
+        self.cache_size = cache_size
+        self._summaries = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+        self.summaries_built = 0
+        self.summary_failures = 0
+
+    def _split(self, chat_history) -> Tuple[List[Turn], List[Turn]]:
+        turns = [tuple(turn) for turn in chat_history or []]
+        cut = max(0, len(turns) - self.keep_turns)
+        return turns[:cut], turns[cut:]
+
+    def _latest_summary(self, digests: List[str]) -> Tuple[str, int]:
+        """Return (summary, turns it covers) for the longest summarized prefix."""
+        with self._lock:
+            for covered in range(len(digests) - 1, 0, -1):
+                summary = self._summaries.get(digests[covered])
+                if summary is not None:
+                    self._summaries.move_to_end(digests[covered])
+                    return summary, covered
+        return "", 0
+
+    def compact(self, chat_history) -> Tuple[str, List[Turn]]:
+        """
+        Split a history into (summary of older turns, recent turns).
+
+        Older turns the cached summary does not cover yet are returned with
+        the recent ones, up to keep_turns more; anything older than that is
+        dropped until the background summary catches up.
+        """
+        older, recent = self._split(chat_history)
+        if not older:
+            return "", recent
+        digests = _prefix_digests(older)
+        summary, covered = self._latest_summary(digests)
+        if covered < len(older):
+            self._schedule(older, digests)
+        backlog = older[covered:][-self.keep_turns:] if self.keep_turns else []
+        return summary, backlog + recent
+
+    def prepare(self, chat_history) -> None:
+        """Summarize the older part of a history in the background, ahead of the next turn."""
+        older, _ = self._split(chat_history)
+        if older:
+            digests = _prefix_digests(older)
+            if self._latest_summary(digests)[1] < len(older):
+                self._schedule(older, digests)
+
+    def _schedule(self, older: List[Turn], digests: List[str]) -> None:
+        key = digests[-1]
+        with self._lock:
+            if key in self._pending or key in self._summaries:
+                return
+            self._pending.add(key)
+        self._pool.submit(contextvars.copy_context().run, self._update, older, digests)
+
+    def _update(self, older: List[Turn], digests: List[str]) -> None:
+        key = digests[-1]
+        try:
+            summary, covered = self._latest_summary(digests)
+            if covered >= len(older):
+                return
+            prompt = SUMMARY_PROMPT.format(
+                summary=summary or "(none yet)",
+                turns=_format_turns(older[covered:]),
+                words=self.summary_words,
+            )
+            with llm_priority(BACKGROUND):
+                response = self.llm.invoke(prompt)
+            text = (response.content if hasattr(response, "content") else str(response)).strip()
+            if not text:
+                return
+            with self._lock:
+                self._summaries[key] = text
+                self._summaries.move_to_end(key)
+                while len(self._summaries) > self.cache_size:
+                    self._summaries.popitem(last=False)
+                self.summaries_built += 1
+        except Exception as e:
+            self.summary_failures += 1
+            print(f"⚠️  Chat history summary failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Block until summaries queued so far are built (mainly for scripts)."""
+        self._pool.submit(lambda: None).result(timeout=timeout)
+
+    def stats(self) -> dict:
+        return {
+            "keep_turns": self.keep_turns,
+            "summaries": len(self._summaries),
+            "pending": len(self._pending),
+            "built": self.summaries_built,
+            "failures": self.summary_failures,
+        }
+
+
+def create_history_manager(llm) -> HistoryManager:
+    """
+    Factory function to create the chat history manager from the environment.
+
+    Honours CHAT_HISTORY_TURNS, CHAT_SUMMARY_WORDS and CHAT_SUMMARY_CACHE_SIZE.
+    """
+    return HistoryManager(llm)
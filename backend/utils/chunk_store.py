@@ -0,0 +1,110 @@
+import json
+import mmap
+import os
+from collections.abc import Mapping
+from typing import Iterable, Iterator
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+RECORDS_FILE = "chunks.jsonl"
+OFFSETS_FILE = "chunks.offsets.npy"
+
+
+def write_chunk_store(directory: str, documents: Iterable[Document]) -> int:
+    """
+    Write documents as an offset-indexed record file.
+
+    Each document becomes one JSON line ({"id", "text", "metadata"}) in
+    chunks.jsonl, and chunks.offsets.npy holds the n + 1 byte offsets that
+    delimit them, so record i can be sliced out without parsing the others.
+
+    Returns:
+        Number of records written
+    """
+    offsets = [0]
+    with open(os.path.join(directory, RECORDS_FILE), "wb") as f:
+        for doc in documents:
+            line = json.dumps(
+                {"id": doc.id, "text": doc.page_content, "metadata": doc.metadata},
+                ensure_ascii=False,
+            ).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+        f.flush()
+        os.fsync(f.fileno())
+    np.save(os.path.join(directory, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+    return len(offsets) - 1
+
+
+class ChunkStore(Docstore):
+    """
+    Read-only docstore over a memory-mapped record file.
+
+    Documents are looked up by index position, which is also what the
+    index_to_docstore_id mapping of a loaded index returns (see Positions).
+    Nothing is deserialized up front: opening a store maps two files, and
+    each lookup decodes a single record. Every process mapping the same
+    files shares their pages through the OS page cache.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        path = os.path.join(directory, RECORDS_FILE)
+        self.size_bytes = os.path.getsize(path)
+        self._data = None
+        if self.size_bytes:
+            with open(path, "rb") as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def record(self, position: int) -> dict:
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return json.loads(self._data[start:end])
+
+    def search(self, search: int) -> Document:
+        try:
+            position = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= position < len(self):
+            return f"ID {search} not found."
+        rec = self.record(position)
+        return Document(id=rec["id"], page_content=rec["text"], metadata=rec["metadata"])
+
+    def __iter__(self) -> Iterator[Document]:
+        for position in range(len(self)):
+            yield self.search(position)
+
+    def add(self, texts: dict) -> None:
+        raise NotImplementedError("ChunkStore is read-only; write a new version instead.")
+
+    def delete(self, ids: list) -> None:
+        raise NotImplementedError("ChunkStore is read-only; write a new version instead.")
+
+
+class Positions(Mapping):
+    """
+    index_to_docstore_id for a ChunkStore: index position i maps to i.
+
+    Stands in for the {position: id} dict the LangChain FAISS wrapper uses,
+    without materializing one entry per vector.
+    """
+
+    def __init__(self, count: int):
+        self.count = count
+
+    def __getitem__(self, position: int) -> int:
+        if not isinstance(position, (int, np.integer)) or not 0 <= position < self.count:
+            raise KeyError(position)
+        return int(position)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.count))
@@ -0,0 +1,218 @@
+import os
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from utils.batching import context_window_for, estimate_tokens, output_limit_for
+from utils.bm25 import BM25Index
+
+# Candidates the chat retriever fetches before deduplication, reranking and packing.
+CHAT_CANDIDATES = int(os.environ.get("CHAT_CANDIDATES", "20"))
+# Upper bound on context tokens per chat prompt; the model's window may lower it.
+CHAT_CONTEXT_TOKENS = int(os.environ.get("CHAT_CONTEXT_TOKENS", "3000"))
+# MMR trade-off: 1.0 ranks purely by relevance, 0.0 purely by novelty.
+MMR_LAMBDA = float(os.environ.get("MMR_LAMBDA", "0.7"))
+# Candidates at least this similar (cosine) to an already chosen chunk are dropped.
+DEDUP_THRESHOLD = float(os.environ.get("CHAT_DEDUP_THRESHOLD", "0.95"))
+# Reranker: "lexical", "cross-encoder" (needs sentence-transformers) or "none".
+RERANKER = os.environ.get("CHAT_RERANKER", "lexical").lower()
+RERANK_MODEL = os.environ.get("CHAT_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Weight of the BM25 score against dense similarity in the lexical reranker.
+LEXICAL_WEIGHT = float(os.environ.get("CHAT_LEXICAL_WEIGHT", "0.3"))
+
+# Tokens kept free for chat formatting and the answer template.
+_PROMPT_MARGIN_TOKENS = 100
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"⚠️  tiktoken unavailable, estimating tokens from length: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken's cl100k_base, or estimate them (chars / 4)."""
+    encoding = _encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def _min_max(scores: np.ndarray) -> np.ndarray:
+    spread = scores.max() - scores.min() if len(scores) else 0.0
+    if spread <= 0:
+        return np.ones_like(scores)
+    return (scores - scores.min()) / spread
+
+
+def mmr(relevance: np.ndarray, vectors: np.ndarray, lambda_mult: float = MMR_LAMBDA,
+        dedup_threshold: float = DEDUP_THRESHOLD) -> List[int]:
+    """
+    Order candidates by maximal marginal relevance.
+
+    Each step picks the candidate maximizing
+    lambda * relevance - (1 - lambda) * max similarity to those already
+    picked. Candidates whose similarity to a picked one reaches
+    dedup_threshold are dropped outright.
+
+    Args:
+        relevance: Relevance score per candidate, in [0, 1]
+        vectors: Unit-normalized candidate embeddings, one row per candidate
+        lambda_mult: Relevance/novelty trade-off
+        dedup_threshold: Cosine similarity treated as a near-duplicate
+
+    Returns:
+        Candidate indices in selection order
+    """
+    remaining = list(range(len(relevance)))
+    chosen: List[int] = []
+    redundancy = np.zeros(len(relevance), dtype=np.float32)
+    while remaining:
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy[remaining]
+        best = remaining.pop(int(np.argmax(scores)))
+        chosen.append(best)
+        if remaining:
+            similarity = vectors[remaining] @ vectors[best]
+            redundancy[remaining] = np.maximum(redundancy[remaining], similarity)
+            remaining = [i for i, s in zip(remaining, similarity) if s < dedup_threshold]
+    return chosen
+
+
+class LexicalReranker:
+    """Blend dense similarity with BM25 computed over the candidate set."""
+
+    def __init__(self, weight: float = LEXICAL_WEIGHT):
+        self.weight = weight
+
+    def score(self, query: str, docs: Sequence[Document], dense: np.ndarray) -> np.ndarray:
+        index = BM25Index.build((str(i), d.page_content) for i, d in enumerate(docs))
+        lexical = np.zeros(len(docs), dtype=np.float32)
+        for chunk_id, score in index.search(query, len(docs)):
+            lexical[int(chunk_id)] = score
+        return (1 - self.weight) * _min_max(dense) + self.weight * _min_max(lexical)
+
+
+class CrossEncoderReranker:
+    """
+    Score (query, chunk) pairs with a local sentence-transformers cross-encoder.
+
+    Raises:
+        ImportError: If sentence-transformers is not installed
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name)
+
+    def score(self, query: str, docs: Sequence[Document], dense: np.ndarray) -> np.ndarray:
+        scores = self.model.predict([(query, d.page_content) for d in docs])
+        return _min_max(np.asarray(scores, dtype=np.float32))
+
+
+class ContextBuilder:
+    """
+    Turn over-fetched retrieval candidates into a compact, token-budgeted context.
+
+    Candidates are embedded (through the shared embedding cache, so chunks
+    indexed earlier cost nothing), scored for relevance by the reranker or
+    by dense similarity, ordered by MMR with near-duplicates dropped, and
+    packed in that order until the token budget is spent.
+    """
+
+    def __init__(self, embeddings: Embeddings, llm=None, reranker=None,
+                 max_context_tokens: int = CHAT_CONTEXT_TOKENS, lambda_mult: float = MMR_LAMBDA,
+                 dedup_threshold: float = DEDUP_THRESHOLD):
+        self.embeddings = embeddings
+        self.llm = llm
+        self.reranker = reranker
+        self.max_context_tokens = max_context_tokens
+        self.lambda_mult = lambda_mult
+        self.dedup_threshold = dedup_threshold
+
+    def budget(self, prompt_tokens: int = 0) -> int:
+        """Context tokens available once the rest of the prompt and the answer are accounted for."""
+        available = context_window_for(self.llm) - output_limit_for(self.llm) - prompt_tokens - _PROMPT_MARGIN_TOKENS
+        return max(0, min(self.max_context_tokens, available))
+
+    def select(self, question: str, docs: List[Document], prompt_tokens: int = 0,
+               budget: Optional[int] = None) -> List[Document]:
+        """
+        Pick the documents to put in the prompt, best first.
+
+        Args:
+            question: The user's question
+            docs: Retrieved candidates, best first
+            prompt_tokens: Tokens already used by the system prompt, history and question
+            budget: Context token budget; derived from the model if None
+
+        Returns:
+            The chosen documents, whose combined text fits the budget
+        """
+        if budget is None:
+            budget = self.budget(prompt_tokens)
+        if len(docs) > 1:
+            docs = self._rank(question, docs)
+
+        chosen, used = [], 0
+        for doc in docs:
+            tokens = count_tokens(doc.page_content)
+            if used + tokens > budget:
+                # Always answer from something, even if one chunk overshoots.
+                if not chosen:
+                    chosen.append(doc)
+                continue
+            chosen.append(doc)
+            used += tokens
+        return chosen
+
+    def _rank(self, question: str, docs: List[Document]) -> List[Document]:
+        query = _normalize(np.asarray(self.embeddings.embed_query(question), dtype=np.float32))
+        vectors = _normalize(np.asarray(
+            self.embeddings.embed_documents([d.page_content for d in docs]), dtype=np.float32
+        ))
+        dense = vectors @ query
+        relevance = _min_max(dense)
+        if self.reranker is not None:
+            try:
+                relevance = self.reranker.score(question, docs, dense)
+            except Exception as e:
+                print(f"⚠️  Reranking failed, using dense similarity: {e}")
+        order = mmr(relevance, vectors, self.lambda_mult, self.dedup_threshold)
+        return [docs[i] for i in order]
+
+
+def create_reranker(kind: str = RERANKER):
+    """Return the configured reranker, falling back to lexical if a cross-encoder is unavailable."""
+    if kind in ("cross-encoder", "cross_encoder", "crossencoder"):
+        try:
+            reranker = CrossEncoderReranker()
+            print(f"✓ Chat reranker: cross-encoder {RERANK_MODEL}")
+            return reranker
+        except Exception as e:
+            print(f"⚠️  Cross-encoder reranker unavailable, using lexical: {e}")
+            return LexicalReranker()
+    if kind == "lexical":
+        return LexicalReranker()
+    return None
+
+
+def create_context_builder(embeddings: Embeddings, llm=None) -> ContextBuilder:
+    """
+    Factory function to create the chat context builder from the environment.
+
+    Honours CHAT_CONTEXT_TOKENS, MMR_LAMBDA, CHAT_DEDUP_THRESHOLD and
+    CHAT_RERANKER.
+    """
+    return ContextBuilder(embeddings, llm=llm, reranker=create_reranker())
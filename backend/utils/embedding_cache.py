@@ -0,0 +1,298 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Query embeddings remembered in memory per process (chat questions repeat
+# within a request: answer cache, retrieval and reranking all embed them).
+QUERY_CACHE_SIZE = int(os.environ.get("EMBEDDING_QUERY_CACHE_SIZE", "1024"))
+# Cache hits whose last_used updates are buffered before being written.
+TOUCH_FLUSH_SIZE = int(os.environ.get("EMBEDDING_CACHE_TOUCH_FLUSH", "1024"))
+
+
+class EmbeddingCache:
+    """
+    Disk-backed, content-addressed store for embedding vectors.
+
+    Entries are keyed by (provider, model, sha256(text)). Each provider/model
+    pair gets its own memory-mapped vector file (float16 by default) and a
+    shared SQLite table maps text hashes to rows in that file. When a
+    namespace exceeds max_entries the least recently used rows are evicted
+    and their slots reused, so the files never grow past the limit.
+
+    Several processes (e.g. uvicorn workers) may share one cache directory.
+    Writes run inside a SQLite BEGIN EXCLUSIVE transaction, which serializes
+    slot assignment, file growth and vector writes across processes, not
+    just threads, and keeps lookups out while a reused slot is rewritten.
+    Lookups only read, in a deferred transaction, so they proceed in
+    parallel across processes; the last_used times of their hits are
+    buffered and written in batches, or by the next put_many().
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 200_000, dtype: str = "float16"):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # Autocommit mode: transactions are opened explicitly by _transaction().
+        self._db = sqlite3.connect(
+            os.path.join(cache_dir, "index.db"), check_same_thread=False, timeout=60, isolation_level=None
+        )
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS spaces (
+                ns TEXT PRIMARY KEY, dim INTEGER NOT NULL, capacity INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                ns TEXT NOT NULL, digest TEXT NOT NULL, slot INTEGER NOT NULL,
+                last_used REAL NOT NULL, PRIMARY KEY (ns, digest)
+            );
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries (ns, last_used);
+            """
+        )
+        self._maps = {}
+        self._touched = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @contextmanager
+    def _transaction(self, write: bool = True):
+        """
+        Hold the thread lock and a SQLite transaction for the block.
+
+        A write transaction (BEGIN EXCLUSIVE) takes the database lock up front,
+        so no other process can read, assign slots or write vectors until this
+        block commits. A read transaction shares the database with other
+        readers and only waits for writers.
+        """
+        with self._lock:
+            self._db.execute("BEGIN EXCLUSIVE" if write else "BEGIN")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    @staticmethod
+    def digest(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _vector_path(self, ns: str) -> str:
+        name = hashlib.sha1(ns.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{name}.{self.dtype.name}")
+
+    def _space(self, ns: str):
+        row = self._db.execute("SELECT dim, capacity FROM spaces WHERE ns = ?", (ns,)).fetchone()
+        return row if row else (None, 0)
+
+    def _vectors(self, ns: str, dim: int, capacity: int) -> np.memmap:
+        """Return the memmap for a namespace, growing the file if needed."""
+        cached = self._maps.get(ns)
+        if cached is not None and cached.shape[0] >= capacity:
+            return cached
+        path = self._vector_path(ns)
+        size = capacity * dim * self.dtype.itemsize
+        if cached is not None:
+            cached.flush()
+        with open(path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        vectors = np.memmap(path, dtype=self.dtype, mode="r+", shape=(capacity, dim))
+        self._maps[ns] = vectors
+        return vectors
+
+    def _slots(self, ns: str, digests: List[str]) -> dict:
+        """Map the cached subset of digests to their vector slots."""
+        slots = {}
+        unique = list(set(digests))
+        # Stay below SQLite's bound-parameter limit.
+        for start in range(0, len(unique), 500):
+            part = unique[start:start + 500]
+            rows = self._db.execute(
+                f"SELECT digest, slot FROM entries WHERE ns = ? AND digest IN ({','.join('?' * len(part))})",
+                [ns, *part],
+            ).fetchall()
+            slots.update(rows)
+        return slots
+
+    def get_many(self, ns: str, digests: List[str]) -> List[Optional[List[float]]]:
+        """Look up vectors by text hash; missing entries come back as None."""
+        with self._transaction(write=False):
+            dim, capacity = self._space(ns)
+            if dim is None:
+                self.misses += len(digests)
+                return [None] * len(digests)
+            vectors = self._vectors(ns, dim, capacity)
+            slots = self._slots(ns, digests)
+            now = time.time()
+            self._touched.update(((ns, d), now) for d in slots)
+            flush = len(self._touched) >= TOUCH_FLUSH_SIZE
+            out = []
+            for d in digests:
+                slot = slots.get(d)
+                if slot is None:
+                    self.misses += 1
+                    out.append(None)
+                else:
+                    self.hits += 1
+                    out.append(vectors[slot].astype(np.float32).tolist())
+        if flush:
+            with self._transaction():
+                self._write_touches()
+        return out
+
+    def _write_touches(self) -> None:
+        """Write buffered last_used times. Caller holds a write transaction."""
+        self._db.executemany(
+            "UPDATE entries SET last_used = MAX(last_used, ?) WHERE ns = ? AND digest = ?",
+            [(at, ns, d) for (ns, d), at in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def put_many(self, ns: str, digests: List[str], embeddings: List[List[float]]) -> None:
+        """Store vectors, evicting least recently used entries when full."""
+        if not digests:
+            return
+        with self._transaction():
+            # Recent hits count before choosing what to evict.
+            self._write_touches()
+            dim, capacity = self._space(ns)
+            if dim is None:
+                dim = len(embeddings[0])
+            count, next_slot = self._db.execute(
+                "SELECT COUNT(*), COALESCE(MAX(slot) + 1, 0) FROM entries WHERE ns = ?", (ns,)
+            ).fetchone()
+            now = time.time()
+            pending = dict(zip(digests, embeddings))
+            for d in self._slots(ns, list(pending)):
+                pending.pop(d)
+            if not pending:
+                return
+            if len(pending) > self.max_entries:
+                pending = dict(list(pending.items())[-self.max_entries:])
+
+            free_slots = []
+            overflow = count + len(pending) - self.max_entries
+            if overflow > 0:
+                victims = self._db.execute(
+                    "SELECT digest, slot FROM entries WHERE ns = ? ORDER BY last_used LIMIT ?",
+                    (ns, overflow),
+                ).fetchall()
+                self._db.executemany("DELETE FROM entries WHERE ns = ? AND digest = ?", [(ns, d) for d, _ in victims])
+                free_slots = [slot for _, slot in victims]
+                self.evictions += len(victims)
+
+            assignments = []
+            for d in pending:
+                if free_slots:
+                    slot = free_slots.pop()
+                else:
+                    slot = next_slot
+                    next_slot += 1
+                assignments.append((d, slot))
+
+            needed = max(capacity, next_slot)
+            if needed > capacity:
+                capacity = min(max(needed, capacity * 2, 1024), max(self.max_entries, needed))
+            vectors = self._vectors(ns, dim, capacity)
+            for d, slot in assignments:
+                vectors[slot] = np.asarray(pending[d], dtype=np.float32).astype(self.dtype)
+            vectors.flush()
+            self._db.execute(
+                "INSERT OR REPLACE INTO spaces (ns, dim, capacity) VALUES (?, ?, ?)",
+                (ns, dim, capacity),
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO entries (ns, digest, slot, last_used) VALUES (?, ?, ?, ?)",
+                [(ns, d, slot, now) for d, slot in assignments],
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries_per_model": self.max_entries,
+            "dtype": self.dtype.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that consults an EmbeddingCache before the provider.
+
+    Only texts that miss the cache are sent to the wrapped embeddings object,
+    so re-ingesting a known document costs no embedding calls at all.
+
+    Providers embed queries differently from documents (task types or
+    "query:" prefixes), so query vectors never share the document cache.
+    They are kept in a small in-process LRU instead, which also spares each
+    chat question a disk write.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, provider: str, model: str,
+                 max_queries: int = QUERY_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.namespace = f"{provider}:{model}"
+        self.max_queries = max_queries
+        self._queries = OrderedDict()
+        self._queries_lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        digests = [self.cache.digest(t) for t in texts]
+        vectors = self.cache.get_many(self.namespace, digests)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            # Embed each distinct missing text once, even if it repeats.
+            first = {}
+            for i in missing:
+                first.setdefault(digests[i], i)
+            fresh = self.embeddings.embed_documents([texts[i] for i in first.values()])
+            by_digest = dict(zip(first.keys(), fresh))
+            self.cache.put_many(self.namespace, list(by_digest.keys()), list(by_digest.values()))
+            for i in missing:
+                vectors[i] = by_digest[digests[i]]
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._queries_lock:
+            vector = self._queries.get(text)
+            if vector is not None:
+                self._queries.move_to_end(text)
+                return vector
+        vector = self.embeddings.embed_query(text)
+        with self._queries_lock:
+            self._queries[text] = vector
+            while len(self._queries) > self.max_queries:
+                self._queries.popitem(last=False)
+        return vector
+
+
+def create_embedding_cache(cache_dir: str = "./outputs/embedding_cache") -> EmbeddingCache:
+    """
+    Factory function to create the shared embedding cache from the environment.
+
+    Honours EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES and
+    EMBEDDING_CACHE_DTYPE (float16 or float32).
+    """
+    return EmbeddingCache(
+        cache_dir=os.environ.get("EMBEDDING_CACHE_DIR", cache_dir),
+        max_entries=int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "200000")),
+        dtype=os.environ.get("EMBEDDING_CACHE_DTYPE", "float16"),
+    )
@@ -0,0 +1,239 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+# Largest batch each provider accepts in one embedding request.
+MAX_BATCH_SIZE = {
+    "Ollama": 128,
+    "Google Gemini": 100,
+    "OpenAI": 2048,
+}
+
+# Embedding requests in flight at once per provider.
+DEFAULT_CONCURRENCY = {
+    "Ollama": 2,
+    "Google Gemini": 4,
+    "OpenAI": 4,
+}
+
+# Batch size used before any latency has been observed.
+INITIAL_BATCH_SIZE = 16
+
+
+class AdaptiveBatchSize:
+    """
+    Latency-driven controller for batch sizes.
+
+    Batches that finish under the target latency grow the next batch by a
+    quarter (multiplicatively, so it ramps up quickly); slow or failed
+    batches halve it. The size stays in [1, maximum].
+    """
+
+    def __init__(self, maximum: int, target_seconds: float, initial: int = INITIAL_BATCH_SIZE):
+        self.maximum = max(1, maximum)
+        self.target_seconds = target_seconds
+        self.current = min(initial, self.maximum)
+        self._lock = threading.Lock()
+
+    def record(self, size: int, seconds: Optional[float]) -> None:
+        """Record a finished batch; seconds is None if it failed."""
+        with self._lock:
+            if seconds is None or seconds > self.target_seconds:
+                self.current = max(1, min(self.current, size) // 2)
+            elif size >= self.current:
+                self.current = min(self.maximum, self.current + max(1, self.current // 4))
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that sends documents to the provider in concurrent batches.
+
+    Texts are split into batches whose size adapts to observed latency (see
+    AdaptiveBatchSize) and at most max_concurrency batches are in flight, across
+    all callers. A failed batch is split in half and only those halves are
+    retried, with exponential backoff, up to max_retries times.
+
+    Ollama's legacy embeddings client makes one HTTP call per text; when
+    wrapping it, batches go to Ollama's /api/embed endpoint instead, in one
+    call per batch. That endpoint returns unit-length vectors, so "model"
+    carries an "@embed" suffix to keep them apart from per-text vectors in
+    the embedding cache and in the index manifest. Set
+    OLLAMA_EMBED_API=embeddings to keep the legacy endpoint (still batched
+    and run concurrently here); see also use_legacy_endpoint().
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        provider: str,
+        max_batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        max_retries: int = 3,
+        target_seconds: float = 2.0,
+    ):
+        self.embeddings = embeddings
+        self.provider = provider
+        self.max_concurrency = max(1, max_concurrency or DEFAULT_CONCURRENCY.get(provider, 2))
+        self.max_retries = max_retries
+        self.batch_size = AdaptiveBatchSize(max_batch_size or MAX_BATCH_SIZE.get(provider, 64), target_seconds)
+        self.model = str(getattr(embeddings, "model", None) or "default")
+        self._ollama_batch_api = (
+            provider == "Ollama" and os.environ.get("OLLAMA_EMBED_API", "embed").lower() == "embed"
+        )
+        if self._ollama_batch_api:
+            self.model += "@embed"
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embed")
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.chunks = 0
+        self.retries = 0
+        self.failures = 0
+        # Time with at least one embed_documents() call running; overlapping
+        # callers are counted once, so chunks_per_second is real throughput.
+        self.busy_seconds = 0.0
+        self._active = 0
+        self._busy_since = 0.0
+
+    def use_legacy_endpoint(self) -> None:
+        """
+        Embed with the provider's own per-text calls, as before batching.
+
+        Used when an existing index was built that way, so that new vectors
+        stay comparable with it. Call before anything keys on self.model.
+        """
+        if self._ollama_batch_api:
+            self._ollama_batch_api = False
+            self.model = self.model[:-len("@embed")]
+
+    def _embed_batch(self, texts: List[str], query: bool = False) -> List[List[float]]:
+        """Embed one batch with a single provider request where possible."""
+        if self._ollama_batch_api:
+            from utils.ollama_llm import _get_session
+
+            instruction = self.embeddings.query_instruction if query else self.embeddings.embed_instruction
+            res = _get_session(self.embeddings.base_url).post(
+                f"{self.embeddings.base_url}/api/embed",
+                json={"model": self.embeddings.model, "input": [f"{instruction}{t}" for t in texts]},
+                timeout=300,
+            )
+            res.raise_for_status()
+            return res.json()["embeddings"]
+        if query:
+            return [self.embeddings.embed_query(texts[0])]
+        return self.embeddings.embed_documents(texts)
+
+    def _timed_batch(self, texts: List[str], delay: float) -> tuple:
+        if delay:
+            time.sleep(delay)
+        start = time.perf_counter()
+        vectors = self._embed_batch(texts)
+        if len(vectors) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+        return vectors, time.perf_counter() - start
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts in adaptive, concurrent batches, preserving order.
+
+        Raises:
+            Exception: The last error of a batch that still fails after max_retries
+        """
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        with self._stats_lock:
+            if not self._active:
+                self._busy_since = time.perf_counter()
+            self._active += 1
+        cursor = 0
+        retry = deque()
+        in_flight = {}
+        try:
+            while cursor < len(texts) or retry or in_flight:
+                while len(in_flight) < self.max_concurrency and (retry or cursor < len(texts)):
+                    if retry:
+                        start, end, attempt = retry.popleft()
+                    else:
+                        start, end, attempt = cursor, min(cursor + self.batch_size.current, len(texts)), 0
+                        cursor = end
+                    delay = 0.5 * 2 ** (attempt - 1) if attempt else 0.0
+                    # Copy the caller's context so context variables follow each batch.
+                    future = self._pool.submit(
+                        contextvars.copy_context().run, self._timed_batch, texts[start:end], delay
+                    )
+                    in_flight[future] = (start, end, attempt)
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, end, attempt = in_flight.pop(future)
+                    try:
+                        batch_vectors, seconds = future.result()
+                    except Exception as e:
+                        self.batch_size.record(end - start, None)
+                        with self._stats_lock:
+                            self.failures += 1
+                        if attempt >= self.max_retries:
+                            raise
+                        print(f"⚠️  Embedding batch of {end - start} failed ({e}); retrying")
+                        with self._stats_lock:
+                            self.retries += 1
+                        # Retry smaller halves, in case the batch was too large for the provider.
+                        mid = (start + end) // 2
+                        if end - start > 1:
+                            retry.extend([(start, mid, attempt + 1), (mid, end, attempt + 1)])
+                        else:
+                            retry.append((start, end, attempt + 1))
+                        continue
+                    vectors[start:end] = batch_vectors
+                    self.batch_size.record(end - start, seconds)
+                    with self._stats_lock:
+                        self.batches += 1
+                        self.chunks += end - start
+        finally:
+            for future in in_flight:
+                future.cancel()
+            with self._stats_lock:
+                self._active -= 1
+                if not self._active:
+                    self.busy_seconds += time.perf_counter() - self._busy_since
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text], query=True)[0]
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            busy = self.busy_seconds + (time.perf_counter() - self._busy_since if self._active else 0.0)
+            return {
+                "provider": self.provider,
+                "model": self.model,
+                "batch_size": self.batch_size.current,
+                "max_batch_size": self.batch_size.maximum,
+                "max_concurrency": self.max_concurrency,
+                "batches": self.batches,
+                "chunks": self.chunks,
+                "retries": self.retries,
+                "failures": self.failures,
+                "chunks_per_second": round(self.chunks / busy, 2) if busy else 0.0,
+            }
+
+
+def create_batched_embeddings(embeddings: Embeddings, provider: str) -> BatchedEmbeddings:
+    """
+    Factory function to wrap provider embeddings in a BatchedEmbeddings executor.
+
+    Honours EMBED_MAX_BATCH_SIZE, EMBED_CONCURRENCY, EMBED_MAX_RETRIES and
+    EMBED_TARGET_SECONDS (the batch latency the batch size adapts towards).
+    """
+    return BatchedEmbeddings(
+        embeddings,
+        provider=provider,
+        max_batch_size=int(os.environ.get("EMBED_MAX_BATCH_SIZE", "0")) or None,
+        max_concurrency=int(os.environ.get("EMBED_CONCURRENCY", "0")) or None,
+        max_retries=int(os.environ.get("EMBED_MAX_RETRIES", "3")),
+        target_seconds=float(os.environ.get("EMBED_TARGET_SECONDS", "2.0")),
+    )
@@ -1,20 +1,29 @@
 import os
+import threading
 import google.generativeai as genai
 from langchain_core.language_models import LLM
-from langchain_core.callbacks.manager import CallbackManagerForLLMRun
-from typing import Optional, List, Any
+from langchain_core.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.outputs import GenerationChunk
+from pydantic import PrivateAttr
+from typing import Optional, List, Any, AsyncIterator, Dict, Iterator
 
 class GoogleLLM(LLM):
     """
     Wrapper around Google Generative AI (Gemini) to be compatible with LangChain.
+
+    The GenerativeModel for the current settings is built once and reused
+    by every call; changing a setting builds (and caches) a new one.
     """
-    
+
     model: str = "gemini-2.5-flash"
     temperature: float = 0.1
     top_p: float = 0.95
     top_k: int = 64
     max_output_tokens: int = 8192
 
+    _models: Dict[tuple, Any] = PrivateAttr(default_factory=dict)
+    _models_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
     def __init__(self, api_key, **kwargs):
         super().__init__(**kwargs)
         if not api_key:
@@ -25,6 +34,41 @@ class GoogleLLM(LLM):
     def _llm_type(self) -> str:
         return "google_generative_ai"
 
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "top_k": self.top_k,
+            "max_output_tokens": self.max_output_tokens,
+        }
+
+    def _get_model(self) -> genai.GenerativeModel:
+        """Return the GenerativeModel for the current settings, building it on first use."""
+        key = tuple(self._identifying_params.values())
+        model = self._models.get(key)
+        if model is None:
+            with self._models_lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = genai.GenerativeModel(
+                        model_name=self.model,
+                        generation_config={
+                            "temperature": self.temperature,
+                            "top_p": self.top_p,
+                            "top_k": self.top_k,
+                            "max_output_tokens": self.max_output_tokens,
+                        },
+                    )
+                    self._models[key] = model
+        return model
+
+    @staticmethod
+    def _overrides(stop: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+        # Per-call settings are merged into the model's generation_config by the SDK.
+        return {"stop_sequences": stop} if stop else None
+
     def _call(
         self,
         prompt: str,
@@ -33,20 +77,66 @@ class GoogleLLM(LLM):
         **kwargs: Any,
     ) -> str:
         try:
-            generation_config = {
-                "temperature": self.temperature,
-                "top_p": self.top_p,
-                "top_k": self.top_k,
-                "max_output_tokens": self.max_output_tokens,
-            }
-            
-            model = genai.GenerativeModel(
-                model_name=self.model,
-                generation_config=generation_config
-            )
-            response = model.generate_content(prompt)
+            response = self._get_model().generate_content(prompt, generation_config=self._overrides(stop))
+            return response.text if response.text else ""
+
+        except Exception as e:
+            raise RuntimeError(f"Google Gemini API error: {str(e)}")
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        """Generate text with the SDK's async client, without blocking the event loop."""
+        try:
+            response = await self._get_model().generate_content_async(prompt, generation_config=self._overrides(stop))
             return response.text if response.text else ""
-                
+        except Exception as e:
+            raise RuntimeError(f"Google Gemini API error: {str(e)}")
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        try:
+            for part in self._get_model().generate_content(prompt, generation_config=self._overrides(stop), stream=True):
+                token = part.text if part.text else ""
+                if not token:
+                    continue
+                chunk = GenerationChunk(text=token)
+                if run_manager:
+                    run_manager.on_llm_new_token(token, chunk=chunk)
+                yield chunk
+
+        except Exception as e:
+            raise RuntimeError(f"Google Gemini API error: {str(e)}")
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        """Stream tokens with the SDK's async client."""
+        try:
+            response = await self._get_model().generate_content_async(
+                prompt, generation_config=self._overrides(stop), stream=True
+            )
+            async for part in response:
+                token = part.text if part.text else ""
+                if not token:
+                    continue
+                chunk = GenerationChunk(text=token)
+                if run_manager:
+                    await run_manager.on_llm_new_token(token, chunk=chunk)
+                yield chunk
         except Exception as e:
             raise RuntimeError(f"Google Gemini API error: {str(e)}")
 
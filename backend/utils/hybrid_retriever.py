@@ -0,0 +1,82 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# Documents returned per query, and candidates fetched from each retriever.
+RETRIEVAL_K = int(os.environ.get("RETRIEVAL_K", "4"))
+RETRIEVAL_FETCH_K = int(os.environ.get("RETRIEVAL_FETCH_K", "20"))
+# Reciprocal rank fusion constant; larger values flatten the rank curve.
+RRF_K = int(os.environ.get("RRF_K", "60"))
+
+# Runs the BM25 lookup while the calling thread does the dense search.
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval")
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = RRF_K) -> List[Document]:
+    """
+    Merge ranked lists: each document scores sum(1 / (k + rank)) over the
+    lists it appears in. Documents are matched by id.
+    """
+    scores, docs = {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, 1):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense + BM25 retriever fused with reciprocal rank fusion.
+
+    The FAISS similarity search (which embeds the query) and the BM25 lookup
+    run concurrently, so the keyword pass adds little latency on top of
+    dense retrieval. db and bm25 should come from IndexManager.snapshot(),
+    so both describe the same index version.
+    """
+
+    db: Any
+    bm25: Any
+    k: int = RETRIEVAL_K
+    fetch_k: int = RETRIEVAL_FETCH_K
+    rrf_k: int = RRF_K
+
+    def _dense(self, query: str) -> List[Document]:
+        return self.db.similarity_search(query, k=self.fetch_k)
+
+    def _sparse(self, query: str) -> List[Document]:
+        docs = []
+        for chunk_id, _ in self.bm25.search(query, self.fetch_k):
+            position = self.bm25.positions.get(chunk_id)
+            if position is not None:
+                docs.append(self.db.docstore.search(self.db.index_to_docstore_id[position]))
+        return docs
+
+    def _fuse(self, dense: List[Document], sparse: List[Document]) -> List[Document]:
+        return reciprocal_rank_fusion([dense, sparse], self.rrf_k)[:self.k]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        sparse = _pool.submit(contextvars.copy_context().run, self._sparse, query)
+        dense = self._dense(query)
+        return self._fuse(dense, sparse.result())
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: Optional[AsyncCallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        dense, sparse = await asyncio.gather(
+            asyncio.to_thread(self._dense, query),
+            asyncio.to_thread(self._sparse, query),
+        )
+        return self._fuse(dense, sparse)
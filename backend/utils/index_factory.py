@@ -0,0 +1,221 @@
+import math
+import os
+import time
+from typing import List, Optional
+
+import faiss
+import numpy as np
+
+# Index type: "auto" (chosen by vector count) or one of INDEX_TYPES.
+INDEX_TYPE = os.environ.get("FAISS_INDEX_TYPE", "auto").lower()
+# Vector counts at which "auto" moves from Flat to HNSW, and from HNSW to IVF-PQ.
+HNSW_MIN_VECTORS = int(os.environ.get("FAISS_HNSW_MIN_VECTORS", "20000"))
+IVFPQ_MIN_VECTORS = int(os.environ.get("FAISS_IVFPQ_MIN_VECTORS", "500000"))
+# Vectors sampled to train IVF centroids and PQ codebooks.
+TRAIN_SAMPLE = int(os.environ.get("FAISS_TRAIN_SAMPLE", "100000"))
+# Recall/latency knobs: IVF lists probed per query, HNSW candidate list size.
+NPROBE = int(os.environ.get("FAISS_NPROBE", "16"))
+EF_SEARCH = int(os.environ.get("FAISS_EF_SEARCH", "64"))
+HNSW_M = int(os.environ.get("FAISS_HNSW_M", "32"))
+
+INDEX_TYPES = ("flat", "flat16", "hnsw", "ivf", "ivfpq")
+# Fewest vectors an index type can be trained on; smaller corpora use Flat.
+_MIN_TRAIN = {"ivf": 1_000, "ivfpq": 10_000}
+
+
+def choose_index_type(n_vectors: int) -> str:
+    """Pick an index type for a corpus size, honouring FAISS_INDEX_TYPE."""
+    kind = INDEX_TYPE if INDEX_TYPE in INDEX_TYPES else None
+    if kind is None:
+        if n_vectors < HNSW_MIN_VECTORS:
+            kind = "flat"
+        elif n_vectors < IVFPQ_MIN_VECTORS:
+            kind = "hnsw"
+        else:
+            kind = "ivfpq"
+    if n_vectors < _MIN_TRAIN.get(kind, 0):
+        return "flat"
+    return kind
+
+
+def index_type(index) -> str:
+    """Return the INDEX_TYPES name of a FAISS index."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "flat16"
+    return "flat"
+
+
+def supports_remove(index) -> bool:
+    """
+    True if removing vectors keeps positions contiguous.
+
+    The LangChain FAISS wrapper maps result positions to documents, so only
+    flat storage (which shifts rows on removal) can delete in place. HNSW
+    cannot remove at all and IVF keeps the old ids, so both are rebuilt.
+    """
+    return index_type(index) in ("flat", "flat16")
+
+
+def is_lossy(index) -> bool:
+    """True if reconstructed vectors are only approximations (PQ codes)."""
+    return index_type(index) == "ivfpq"
+
+
+def _nlist(n_vectors: int) -> int:
+    # About 4 * sqrt(n) lists, with at least 39 training points per centroid.
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Largest divisor of dim giving at least 4 dimensions per sub-quantizer."""
+    for m in range(max(1, dim // 4), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def set_search_params(index, nprobe: int = NPROBE, ef_search: int = EF_SEARCH) -> None:
+    """Apply the default recall parameters to an index in place."""
+    kind = index_type(index)
+    if kind == "hnsw":
+        faiss.downcast_index(index).hnsw.efSearch = ef_search
+    elif kind in ("ivf", "ivfpq"):
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(nprobe, ivf.nlist)
+
+
+def build_index(vectors: np.ndarray, kind: Optional[str] = None):
+    """
+    Build and fill a FAISS index of the given type (chosen by size if None).
+
+    IVF centroids and PQ codebooks are trained on a random sample of at most
+    TRAIN_SAMPLE vectors. IVF indexes keep a hashtable direct map so vectors
+    can be reconstructed when the index is rebuilt.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    kind = kind or choose_index_type(n)
+    if kind == "flat16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = max(2 * HNSW_M, 40)
+    elif kind in ("ivf", "ivfpq"):
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, _nlist(n))
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, _nlist(n), _pq_subquantizers(dim), 8)
+        index.own_fields = True
+        quantizer.this.disown()
+    else:
+        index = faiss.IndexFlatL2(dim)
+
+    if not index.is_trained:
+        start = time.perf_counter()
+        sample = vectors
+        if n > TRAIN_SAMPLE:
+            sample = vectors[np.random.default_rng(0).choice(n, TRAIN_SAMPLE, replace=False)]
+        index.train(sample)
+        print(f"✓ Trained {kind} index on {len(sample)} vectors in {time.perf_counter() - start:.2f}s")
+    if kind in ("ivf", "ivfpq"):
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    if n:
+        index.add(vectors)
+    set_search_params(index)
+    return index
+
+
+def memory_bytes(index) -> int:
+    """Approximate resident size of an index's vectors and graph/list overhead."""
+    n, dim = index.ntotal, index.d
+    kind = index_type(index)
+    if kind == "flat16":
+        return n * dim * 2
+    if kind == "hnsw":
+        return n * (dim * 4 + HNSW_M * 2 * 4)
+    if kind == "ivf":
+        return n * (dim * 4 + 8)
+    if kind == "ivfpq":
+        return n * (faiss.downcast_index(index).pq.code_size + 8)
+    return n * dim * 4
+
+
+def _search_params(kind: str, value: int):
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=value)
+    if kind in ("ivf", "ivfpq"):
+        return faiss.SearchParametersIVF(nprobe=value)
+    return None
+
+
+def _sweep(index) -> List[int]:
+    kind = index_type(index)
+    if kind == "hnsw":
+        return [16, 32, 64, 128, 256]
+    if kind in ("ivf", "ivfpq"):
+        nlist = faiss.extract_index_ivf(index).nlist
+        return [p for p in (1, 2, 4, 8, 16, 32, 64, 128, 256) if p <= nlist] or [nlist]
+    return [0]
+
+
+def recall_report(index, vectors: np.ndarray, k: int = 10, queries: int = 200) -> dict:
+    """
+    Measure recall@k and per-query latency of an index against exact search.
+
+    Queries are sampled from the stored vectors; ground truth comes from a
+    flat index over the same (unquantized) vectors. For HNSW and IVF indexes
+    every efSearch / nprobe value of a standard sweep is measured, using
+    per-call search parameters so the shared index is not modified.
+
+    Args:
+        index: The FAISS index to evaluate
+        vectors: The exact vectors stored in the index, in position order
+        k: Neighbours per query
+        queries: Number of sampled queries
+
+    Returns:
+        Dict with the index type, exact-search latency and one row per setting
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n = len(vectors)
+    k = max(1, min(k, n))
+    sample = vectors[np.random.default_rng(0).choice(n, min(queries, n), replace=False)]
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+
+    def timed_search(idx, params=None):
+        labels, latencies = [], []
+        for q in sample:
+            start = time.perf_counter()
+            _, found = idx.search(q[None, :], k, params=params) if params else idx.search(q[None, :], k)
+            latencies.append(time.perf_counter() - start)
+            labels.append(found[0])
+        return labels, float(np.median(latencies)) * 1000, float(np.percentile(latencies, 95)) * 1000
+
+    truth, exact_p50, exact_p95 = timed_search(exact)
+    kind = index_type(index)
+    param_name = {"hnsw": "efSearch", "ivf": "nprobe", "ivfpq": "nprobe"}.get(kind)
+    rows = []
+    for value in _sweep(index):
+        found, p50, p95 = timed_search(index, _search_params(kind, value))
+        recall = np.mean([len(set(f[f >= 0]) & set(t)) / k for f, t in zip(found, truth)])
+        row = {"recall": round(float(recall), 4), "p50_ms": round(p50, 3), "p95_ms": round(p95, 3)}
+        if param_name:
+            row[param_name] = value
+        rows.append(row)
+    return {
+        "index_type": kind,
+        "vectors": n,
+        "k": k,
+        "queries": len(sample),
+        "exact": {"p50_ms": round(exact_p50, 3), "p95_ms": round(exact_p95, 3)},
+        "settings": rows,
+    }
@@ -0,0 +1,637 @@
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+
+from utils.bm25 import BM25Index
+from utils.chunk_store import ChunkStore, Positions, write_chunk_store
+from utils.index_factory import (
+    build_index, choose_index_type, index_type, is_lossy, memory_bytes,
+    recall_report, set_search_params, supports_remove,
+)
+
+# Rebuild the index after this many add/delete operations.
+COMPACT_EVERY = int(os.environ.get("FAISS_COMPACT_EVERY", "20"))
+# Chunks embedded per call while a document is being read.
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))
+# Index versions kept on disk; older ones are deleted after each write.
+KEEP_VERSIONS = int(os.environ.get("FAISS_KEEP_VERSIONS", "3"))
+
+# Map index files read-only instead of copying them into the heap. IVF
+# inverted lists are mapped with IO_FLAG_MMAP; flat, HNSW and SQ storage
+# need IO_FLAG_MMAP_IFC (faiss >= 1.9). The two flags cannot be combined.
+MMAP_FLAGS = {
+    "ivf": faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+    "ivfpq": faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+}
+DEFAULT_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within a process.
+    fcntl = None
+
+
+class IndexManager:
+    """
+    Process-wide owner of the FAISS vector store.
+
+    Each write produces a new immutable version directory holding the FAISS
+    index, an offset-indexed chunk store and a small JSON manifest, and then
+    atomically repoints the CURRENT file at it. Readers open the current
+    version memory-mapped and read-only: nothing is unpickled, opening takes
+    milliseconds, and every worker process serving the same index shares its
+    pages through the OS page cache instead of holding a private copy.
+
+    Every caller shares the same handle, which must be treated as read-only.
+    Writers go through publish() or the per-document methods, which build a
+    private in-memory copy, mutate it and publish it as a new version, so
+    readers never see a half-written index. Writers in different processes
+    are serialized with a lock file, and each starts from the latest version.
+    Other workers pick the new version up on their next get().
+
+    The FAISS index type follows the corpus size (see index_factory): the
+    index is rebuilt as Flat, HNSW or IVF-PQ whenever a save crosses one of
+    the size thresholds. PQ codes cannot give back the original vectors, so
+    IVF-PQ versions also store them exactly (vectors.npy, memory-mapped) for
+    rebuilds and recall reports.
+
+    A BM25 keyword index is kept alongside each version for hybrid search.
+    Writers update a copy of it incrementally, only tokenizing the chunks
+    that were added or removed; see snapshot().
+
+    The manifest records which embeddings produced the vectors (provider,
+    model and endpoint, as embedding_model). A version recorded with other
+    embeddings is still served, with a warning, but refuses writes, so
+    vectors that are not comparable never end up in the same index.
+    """
+
+    INDEX_FILE = "index.faiss"
+    # Exact float32 vectors, kept for lossy (IVF-PQ) versions only.
+    VECTORS_FILE = "vectors.npy"
+    MANIFEST_FILE = "manifest.json"
+    CURRENT_FILE = "CURRENT"
+    LOCK_FILE = ".lock"
+    # Pickle-based layout written by FAISS.save_local() before versioning.
+    LEGACY_FILES = ("index.faiss", "index.pkl")
+
+    def __init__(self, index_path: str, embeddings, embedding_model: Optional[str] = None):
+        self.index_path = index_path
+        self.embeddings = embeddings
+        self.embedding_model = embedding_model
+        self._db: Optional[FAISS] = None
+        self._manifest: Optional[dict] = None
+        self._bm25: Optional[BM25Index] = None
+        self._version = None
+        self._lock = threading.Lock()
+        self._load_seconds = 0.0
+        self._loaded_at = None
+        self._load_count = 0
+        self._mutations = 0
+        self._migrate_legacy()
+        mismatch = self._embedding_mismatch(self.current_manifest(index_path) or {})
+        if mismatch:
+            print(f"⚠️  {mismatch}")
+
+    @classmethod
+    def current_manifest(cls, index_path: str) -> Optional[dict]:
+        """
+        Return the manifest of the index stored at index_path.
+
+        Returns None if there is no index, or an empty dict for a pickled
+        index that predates manifests.
+        """
+        try:
+            with open(os.path.join(index_path, cls.CURRENT_FILE), "r") as f:
+                version = f.read().strip()
+            with open(os.path.join(index_path, version, cls.MANIFEST_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, NotADirectoryError):
+            legacy = [os.path.join(index_path, name) for name in cls.LEGACY_FILES]
+            return {} if all(os.path.exists(p) for p in legacy) else None
+
+    def _embedding_mismatch(self, manifest: dict) -> Optional[str]:
+        """Describe why a version's vectors do not match our embeddings, or return None."""
+        recorded = manifest.get("embedding_model")
+        if recorded and self.embedding_model and recorded != self.embedding_model:
+            return (
+                f"FAISS index {manifest.get('version')} was embedded with {recorded}, but {self.embedding_model} "
+                f"is configured; it is read-only until the original embedding settings are restored "
+                f"(or {self.index_path} is deleted and documents re-uploaded)."
+            )
+        return None
+
+    def _disk_version(self) -> Optional[str]:
+        """Return the name of the current on-disk version, or None if missing."""
+        try:
+            with open(os.path.join(self.index_path, self.CURRENT_FILE), "r") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def exists(self) -> bool:
+        return self._db is not None or self._disk_version() is not None
+
+    def get(self) -> Optional[FAISS]:
+        """
+        Return the shared read-only index, opening it if needed.
+
+        Switches transparently to a newer version written by any process.
+        Returns None if no index has been written yet.
+        """
+        version = self._disk_version()
+        if version is None or (self._db is not None and version == self._version):
+            return self._db
+        with self._lock:
+            return self._load_locked()
+
+    def _load_locked(self) -> Optional[FAISS]:
+        """Open the current version if it changed. Caller must hold the lock."""
+        # Another thread may have switched versions while we waited for the lock.
+        version = self._disk_version()
+        if version is None or (self._db is not None and version == self._version):
+            return self._db
+        start = time.perf_counter()
+        db, manifest = self._open_version(version)
+        self._load_seconds = time.perf_counter() - start
+        self._loaded_at = time.time()
+        self._load_count += 1
+        self._db, self._manifest, self._version = db, manifest, version
+        self._bm25 = None
+        mismatch = self._embedding_mismatch(manifest)
+        if mismatch:
+            print(f"⚠️  {mismatch}")
+        print(f"✓ FAISS index {version} mapped in {self._load_seconds * 1000:.1f}ms ({db.index.ntotal} vectors)")
+        return db
+
+    def _open_version(self, version: str) -> tuple:
+        directory = os.path.join(self.index_path, version)
+        with open(os.path.join(directory, self.MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        flags = MMAP_FLAGS.get(manifest["index_type"], DEFAULT_MMAP_FLAGS)
+        index = faiss.read_index(os.path.join(directory, self.INDEX_FILE), flags)
+        set_search_params(index)
+        db = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=ChunkStore(directory),
+            index_to_docstore_id=Positions(index.ntotal),
+        )
+        return db, manifest
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize writers across processes."""
+        os.makedirs(self.index_path, exist_ok=True)
+        with open(os.path.join(self.index_path, self.LOCK_FILE), "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _writing(self):
+        """Hold both writer locks, starting from the latest version on disk."""
+        with self._lock, self._file_lock():
+            self._load_locked()
+            mismatch = self._embedding_mismatch(self._manifest or {})
+            if mismatch:
+                raise RuntimeError(mismatch)
+            yield
+
+    def _migrate_legacy(self) -> None:
+        """Convert a pickled FAISS.save_local() index to the versioned layout once."""
+        legacy = [os.path.join(self.index_path, name) for name in self.LEGACY_FILES]
+        if not all(os.path.exists(p) for p in legacy) or self._disk_version() is not None:
+            return
+        with self._lock, self._file_lock():
+            if self._disk_version() is not None:
+                return
+            db = FAISS.load_local(self.index_path, self.embeddings, allow_dangerous_deserialization=True)
+            version, _ = self._write_version(db)
+            for p in legacy:
+                os.remove(p)
+            print(f"✓ Migrated pickled FAISS index to {version} ({db.index.ntotal} vectors)")
+
+    def snapshot(self) -> tuple:
+        """
+        Return the current (vector store, BM25 index, version), or
+        (None, None, None).
+
+        Both indexes belong to the named version. The BM25 index is loaded on
+        first use and must be treated as read-only, like the vector store.
+        """
+        if self.get() is None:
+            return None, None, None
+        with self._lock:
+            return self._db, self._sparse_locked(), self._version
+
+    def _sparse_locked(self) -> BM25Index:
+        """Return the current version's BM25 index. Caller must hold the lock."""
+        if self._bm25 is None:
+            directory = self._db.docstore.directory
+            try:
+                self._bm25 = BM25Index.load(directory)
+            except FileNotFoundError:
+                # Versions written before keyword search existed: index them once.
+                docs = list(self._documents(self._db))
+                self._bm25 = BM25Index.build((doc.id, doc.page_content) for doc in docs)
+                try:
+                    self._bm25.save(directory, [doc.id for doc in docs])
+                except OSError as e:
+                    print(f"⚠️  Could not save BM25 index: {e}")
+        return self._bm25
+
+    def publish(self, db: FAISS) -> None:
+        """Persist a new index and atomically swap it in for all readers."""
+        with self._writing():
+            self._save(db, compact=False)
+
+    def _materialize(self, db: FAISS) -> FAISS:
+        """Copy an index into memory so it can be mutated without disturbing readers."""
+        if isinstance(db.docstore, ChunkStore):
+            # A mapped index is a read-only view; read a private copy instead.
+            index = faiss.read_index(os.path.join(db.docstore.directory, self.INDEX_FILE))
+        else:
+            index = faiss.clone_index(db.index)
+        docs = list(self._documents(db))
+        copy = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore({doc.id: doc for doc in docs}),
+            index_to_docstore_id={i: doc.id for i, doc in enumerate(docs)},
+        )
+        if is_lossy(index):
+            # Exact vectors by chunk id, so the copy can be rebuilt and saved without re-embedding.
+            copy.exact_vectors = dict(zip((doc.id for doc in docs), self._vectors(db)))
+        return copy
+
+    @staticmethod
+    def _documents(db: FAISS) -> Iterator[Document]:
+        """Yield every chunk in index order, with Document.id set to its chunk id."""
+        mapped = isinstance(db.docstore, ChunkStore)
+        for i in range(db.index.ntotal):
+            doc_id = db.index_to_docstore_id[i]
+            doc = db.docstore.search(doc_id)
+            if not mapped and doc.id != doc_id:
+                doc = Document(id=doc_id, page_content=doc.page_content, metadata=doc.metadata)
+            yield doc
+
+    @staticmethod
+    def chunk_id(source: str, chunk_no: int) -> str:
+        return f"{source}::{chunk_no}"
+
+    def add_document(
+        self,
+        source: str,
+        chunks: Iterable,
+        content_hash: Optional[str] = None,
+        on_progress: Optional[Callable[[str, int], None]] = None,
+    ) -> int:
+        """
+        Add one document's chunks to the index, replacing any earlier version.
+
+        Only the new chunks are embedded; existing vectors are kept as-is.
+        Chunks are consumed lazily and embedded in batches of EMBED_BATCH_SIZE,
+        so embedding overlaps with extraction when given a generator.
+
+        Args:
+            source: Document identifier, typically the uploaded file name
+            chunks: Chunk texts, or {"text", "page"} dicts, in document order
+            content_hash: Optional SHA-256 of the source file, see find_by_hash()
+            on_progress: Optional callback(stage, chunks_embedded), called after
+                each embedding batch and before the index is written. It may
+                raise to abort the upload before anything is committed.
+
+        Returns:
+            Number of chunks added
+        """
+        texts, metadatas, vectors = [], [], []
+        pending = 0
+        for chunk in chunks:
+            text, metadata = self.chunk_record(source, chunk, len(texts), content_hash)
+            texts.append(text)
+            metadatas.append(metadata)
+            pending += 1
+            # Embed outside the lock so readers and other uploads are not blocked.
+            if pending >= EMBED_BATCH_SIZE:
+                vectors.extend(self.embeddings.embed_documents(texts[-pending:]))
+                pending = 0
+                if on_progress:
+                    on_progress("embedding", len(vectors))
+        if pending:
+            vectors.extend(self.embeddings.embed_documents(texts[-pending:]))
+        if on_progress:
+            on_progress("indexing", len(vectors))
+
+        self.commit_documents([(source, texts, metadatas, vectors)])
+        return len(texts)
+
+    @staticmethod
+    def chunk_record(source: str, chunk, chunk_no: int, content_hash: Optional[str] = None) -> tuple:
+        """Return the (text, metadata) stored for a chunk string or {"text", "page"} dict."""
+        if isinstance(chunk, str):
+            chunk = {"text": chunk, "page": None}
+        metadata = {"source": source, "page": chunk.get("page"), "chunk_id": chunk_no}
+        if content_hash:
+            metadata["content_hash"] = content_hash
+        return chunk["text"], metadata
+
+    def commit_documents(self, documents: List[tuple]) -> int:
+        """
+        Write already-embedded documents to the index in a single swap.
+
+        Each document is a (source, texts, metadatas, vectors) tuple; earlier
+        chunks of the same source are replaced. The index is saved once,
+        however many documents are committed.
+
+        Returns:
+            Number of chunks added
+        """
+        records = []
+        stale_sources = set()
+        for source, texts, metadatas, vectors in documents:
+            stale_sources.add(source)
+            ids = [self.chunk_id(source, i) for i in range(len(texts))]
+            records.extend(zip(texts, vectors, metadatas, ids))
+        if not documents:
+            return 0
+
+        with self._writing():
+            current = self._db
+            if current is None:
+                if not records:
+                    return 0
+                bm25 = BM25Index()
+                texts, vectors, metadatas, ids = (list(column) for column in zip(*records))
+                db = self._new_db(texts, vectors, metadatas, ids)
+            else:
+                bm25 = self._sparse_locked().copy()
+                db = self._materialize(current)
+                stale = [doc for doc in self._documents(db) if doc.metadata.get("source") in stale_sources]
+                for doc in stale:
+                    bm25.remove(doc.id, doc.page_content)
+                if stale:
+                    db = self._delete(db, [doc.id for doc in stale])
+                if records:
+                    texts, vectors, metadatas, ids = (list(column) for column in zip(*records))
+                    db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+                    if getattr(db, "exact_vectors", None) is not None:
+                        db.exact_vectors.update(zip(ids, np.asarray(vectors, dtype=np.float32)))
+            for text, _, _, chunk_id in records:
+                bm25.add(chunk_id, text)
+            self._mutations += 1
+            self._save(db, bm25=bm25)
+        return len(records)
+
+    def delete_document(self, source: str) -> int:
+        """Remove every chunk of a document. Returns the number removed."""
+        with self._writing():
+            if self._db is None:
+                return 0
+            db = self._materialize(self._db)
+            stale = [doc for doc in self._documents(db) if doc.metadata.get("source") == source]
+            if not stale:
+                return 0
+            bm25 = self._sparse_locked().copy()
+            for doc in stale:
+                bm25.remove(doc.id, doc.page_content)
+            db = self._delete(db, [doc.id for doc in stale])
+            self._mutations += 1
+            self._save(db, bm25=bm25)
+            return len(stale)
+
+    def _manifest_snapshot(self) -> Optional[dict]:
+        """Return the current version's manifest, read under the lock writers swap it with."""
+        if self.get() is None:
+            return None
+        with self._lock:
+            return self._manifest
+
+    def find_by_hash(self, content_hash: str) -> Optional[str]:
+        """Return the source already indexed from a file with this hash, if any."""
+        manifest = self._manifest_snapshot()
+        if manifest is None:
+            return None
+        for doc in manifest["documents"]:
+            if doc.get("content_hash") == content_hash:
+                return doc["source"]
+        return None
+
+    def documents(self) -> List[dict]:
+        """List indexed documents with their chunk counts."""
+        manifest = self._manifest_snapshot()
+        if manifest is None:
+            return []
+        return [{"source": d["source"], "chunks": d["chunks"]} for d in manifest["documents"]]
+
+    def compact(self) -> int:
+        """Rebuild the index contiguously and drop orphaned docstore entries."""
+        with self._writing():
+            if self._db is None:
+                return 0
+            bm25 = self._sparse_locked().copy()
+            db = self._compacted(self._db)
+            self._save(db, compact=False, bm25=bm25)
+            return db.index.ntotal
+
+    def _new_db(self, texts: List[str], vectors, metadatas: List[dict], ids: List[str]) -> FAISS:
+        """Create a vector store with an index type suited to its size."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        index = build_index(vectors)
+        mapping = dict(enumerate(ids))
+        docstore = InMemoryDocstore({
+            doc_id: Document(page_content=text, metadata=metadata, id=doc_id)
+            for doc_id, text, metadata in zip(ids, texts, metadatas)
+        })
+        db = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=mapping,
+        )
+        if is_lossy(index):
+            db.exact_vectors = dict(zip(ids, vectors))
+        return db
+
+    def _vectors(self, db: FAISS) -> np.ndarray:
+        """
+        Return the exact vectors of an index, in position order.
+
+        PQ codes only approximate the original vectors, so IVF-PQ indexes
+        read them from the version's vectors.npy (or, for an in-memory copy
+        being written, from its exact_vectors). Other types reconstruct them.
+        """
+        n = db.index.ntotal
+        if not n:
+            return np.zeros((0, db.index.d), dtype=np.float32)
+        if not is_lossy(db.index):
+            return db.index.reconstruct_n(0, n).astype(np.float32)
+        exact = getattr(db, "exact_vectors", None)
+        if exact is not None:
+            return np.stack([exact[db.index_to_docstore_id[i]] for i in range(n)])
+        path = os.path.join(db.docstore.directory, self.VECTORS_FILE)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r")
+        # IVF-PQ versions written before exact vectors were stored.
+        print("⚠️  No stored vectors for this IVF-PQ index; re-embedding its chunks")
+        texts = [doc.page_content for doc in self._documents(db)]
+        return np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+
+    def _delete(self, db: FAISS, doc_ids: List[str]) -> FAISS:
+        """Remove chunks, rebuilding indexes that cannot delete in place."""
+        if supports_remove(db.index):
+            db.delete(doc_ids)
+            return db
+        return self._compacted(db, drop=set(doc_ids))
+
+    def _compacted(self, db: FAISS, drop: frozenset = frozenset()) -> FAISS:
+        """Rebuild the index contiguously, without the drop ids, as the type its size calls for."""
+        vectors = self._vectors(db)
+        docs = list(self._documents(db))
+        keep = [i for i, doc in enumerate(docs) if doc.id not in drop]
+        self._mutations = 0
+        if not keep:
+            return FAISS(
+                embedding_function=self.embeddings,
+                index=faiss.IndexFlatL2(db.index.d),
+                docstore=InMemoryDocstore({}),
+                index_to_docstore_id={},
+            )
+        docs = [docs[i] for i in keep]
+        return self._new_db(
+            [d.page_content for d in docs], vectors[keep], [d.metadata for d in docs], [d.id for d in docs],
+        )
+
+    def _save(self, db: FAISS, compact: bool = True, bm25: Optional[BM25Index] = None) -> None:
+        """
+        Persist and swap in a new index. Caller must hold the lock.
+
+        bm25 must already reflect db's chunks; it is rebuilt from db if None.
+        """
+        if compact and self._mutations >= COMPACT_EVERY:
+            db = self._compacted(db)
+        elif index_type(db.index) != choose_index_type(db.index.ntotal):
+            # The corpus crossed a size threshold; move to the matching index type.
+            print(f"✓ Rebuilding FAISS index as {choose_index_type(db.index.ntotal)} ({db.index.ntotal} vectors)")
+            db = self._compacted(db)
+        version, bm25 = self._write_version(db, bm25)
+        # Serve the new version from its mapped files, like every other worker.
+        self._db, self._manifest = self._open_version(version)
+        self._version, self._bm25 = version, bm25
+        self._loaded_at = time.time()
+
+    def _write_version(self, db: FAISS, bm25: Optional[BM25Index] = None) -> tuple:
+        """
+        Write db as a new version directory and make it current. Caller holds both locks.
+
+        Returns (version, bm25), building the BM25 index from db if none is given.
+        """
+        version = f"v{time.time_ns()}"
+        directory = os.path.join(self.index_path, version)
+        staging = directory + ".tmp"
+        os.makedirs(staging)
+        faiss.write_index(db.index, os.path.join(staging, self.INDEX_FILE))
+        if is_lossy(db.index):
+            np.save(os.path.join(staging, self.VECTORS_FILE), self._vectors(db))
+
+        sources, ids = {}, []
+        built = BM25Index() if bm25 is None else None
+        def tally(docs):
+            for doc in docs:
+                ids.append(doc.id)
+                if built is not None:
+                    built.add(doc.id, doc.page_content)
+                source = doc.metadata.get("source")
+                entry = sources.setdefault(source, {"source": source, "chunks": 0})
+                entry["chunks"] += 1
+                if doc.metadata.get("content_hash"):
+                    entry["content_hash"] = doc.metadata["content_hash"]
+                yield doc
+        write_chunk_store(staging, tally(self._documents(db)))
+        if bm25 is None:
+            bm25 = built
+        bm25.save(staging, ids)
+        manifest = {
+            "version": version,
+            "created_at": time.time(),
+            "vectors": db.index.ntotal,
+            "dimension": db.index.d,
+            "index_type": index_type(db.index),
+            "embedding_model": self.embedding_model,
+            "documents": list(sources.values()),
+        }
+        with open(os.path.join(staging, self.MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.rename(staging, directory)
+
+        pointer = os.path.join(self.index_path, f"{self.CURRENT_FILE}.{os.getpid()}.tmp")
+        with open(pointer, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer, os.path.join(self.index_path, self.CURRENT_FILE))
+        self._prune_versions()
+        return version, bm25
+
+    def _prune_versions(self) -> None:
+        """Delete all but the newest KEEP_VERSIONS versions and abandoned staging dirs."""
+        names = sorted(n for n in os.listdir(self.index_path) if n.startswith("v"))
+        versions = [n for n in names if not n.endswith(".tmp")]
+        # Readers that still map an old version keep their pages until they switch.
+        for name in [n for n in names if n.endswith(".tmp")] + versions[:-max(1, KEEP_VERSIONS)]:
+            shutil.rmtree(os.path.join(self.index_path, name), ignore_errors=True)
+
+    def recall_report(self, k: int = 10, queries: int = 200) -> Optional[dict]:
+        """Compare the current index's recall and latency with exact search."""
+        db = self.get()
+        if db is None or not db.index.ntotal:
+            return None
+        return recall_report(db.index, self._vectors(db), k=k, queries=queries)
+
+    def texts(self):
+        """Return the text of every chunk in the current index."""
+        db = self.get()
+        if db is None:
+            return []
+        return [doc.page_content for doc in self._documents(db)]
+
+    def status(self) -> dict:
+        db = self._db
+        if db is None:
+            return {"loaded": False, "on_disk": self._disk_version() is not None}
+        index = db.index
+        vector_bytes = memory_bytes(index)
+        text_bytes = db.docstore.size_bytes
+        return {
+            "loaded": True,
+            "version": self._version,
+            "storage": "mmap",
+            "vectors": index.ntotal,
+            "dimension": index.d,
+            "index_type": index_type(index),
+            "embedding_model": self._manifest.get("embedding_model"),
+            "read_only": self._embedding_mismatch(self._manifest) is not None,
+            "load_seconds": round(self._load_seconds, 4),
+            "load_count": self._load_count,
+            "mutations_since_compaction": self._mutations,
+            "loaded_at": self._loaded_at,
+            # Mapped pages are shared by every worker serving this version.
+            "mapped_bytes": {
+                "vectors": vector_bytes,
+                "texts": text_bytes,
+                "total": vector_bytes + text_bytes,
+            },
+        }
@@ -0,0 +1,258 @@
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from utils.index_manager import EMBED_BATCH_SIZE
+from utils.pdf_utils import IMAGE_EXTENSIONS, iter_texts_from_images
+
+# Files read and chunked at the same time. PDFs may also fan out to the
+# extraction process pool, so a couple of threads is usually enough.
+EXTRACT_THREADS = int(os.environ.get("INGEST_EXTRACT_THREADS", "2"))
+# Embedding calls in flight at once, across all files of a batch.
+EMBED_THREADS = int(os.environ.get("INGEST_EMBED_THREADS", "2"))
+# Chunk batches buffered between extraction and embedding.
+STAGE_QUEUE_SIZE = int(os.environ.get("INGEST_STAGE_QUEUE_SIZE", "8"))
+
+_STOP = object()
+
+
+class IngestPipeline:
+    """
+    Ingests many files through overlapping extract, embed and collect stages.
+
+    Extraction threads read and chunk files and hand batches of chunks to
+    the embedding threads through a bounded queue; embedded batches flow back
+    to the collector on the calling thread. While one file is still being
+    extracted, batches of another are already being embedded. Nothing is
+    written to the index until every file has been processed; the files that
+    succeeded are then committed in a single swap, and failures are reported
+    per file without aborting the rest of the batch.
+
+    When a batch holds several images, one extraction thread OCRs all of them
+    through the extraction process pool (iter_texts_from_images), so image
+    OCR uses every worker process instead of one extraction thread each.
+    """
+
+    def __init__(
+        self,
+        index_manager,
+        reader,
+        extract_threads: Optional[int] = None,
+        embed_threads: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        queue_size: Optional[int] = None,
+    ):
+        self.index_manager = index_manager
+        self.reader = reader
+        self.extract_threads = max(1, extract_threads or EXTRACT_THREADS)
+        self.embed_threads = max(1, embed_threads or EMBED_THREADS)
+        self.batch_size = max(1, batch_size or EMBED_BATCH_SIZE)
+        self.queue_size = max(1, queue_size or STAGE_QUEUE_SIZE)
+
+    def run(self, files: List[dict], on_progress: Optional[Callable[[str, int, int], None]] = None) -> dict:
+        """
+        Ingest a batch of files and commit them to the index once.
+
+        Args:
+            files: {"source", "path", "sha256"} dicts, one per file
+            on_progress: Optional callback(stage, files_done, chunks_embedded),
+                called from the calling thread as batches complete. It may
+                raise to abort the batch before anything is committed.
+
+        Returns:
+            Dict with a per-file report ("files"), the number of chunks
+            committed, and the commit and total durations in seconds
+        """
+        started = time.perf_counter()
+        reports = [
+            {"source": f["source"], "status": "pending", "chunks": 0, "extract_seconds": 0.0,
+             "embed_seconds": 0.0, "seconds": 0.0, "error": None}
+            for f in files
+        ]
+        images = [i for i, f in enumerate(files) if Path(f["path"]).suffix.lower() in IMAGE_EXTENSIONS]
+        if len(images) < 2:
+            images = []
+        file_queue = queue.Queue()
+        for i in range(len(files)):
+            if i not in images:
+                file_queue.put(i)
+        embed_queue = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue()
+        stop = threading.Event()
+
+        extractors = [
+            threading.Thread(target=self._extract, args=(files, file_queue, embed_queue, results, stop), daemon=True)
+            for _ in range(min(self.extract_threads, len(files) - len(images)))
+        ]
+        if images:
+            extractors.append(threading.Thread(
+                target=self._extract_images, args=(files, images, embed_queue, results, stop), daemon=True
+            ))
+        embedders = [
+            threading.Thread(target=self._embed, args=(embed_queue, results, stop), daemon=True)
+            for _ in range(self.embed_threads)
+        ]
+        for thread in extractors + embedders:
+            thread.start()
+
+        batches = [{} for _ in files]
+        expected = [None] * len(files)
+        file_started = [None] * len(files)
+        done_files, embedded = 0, 0
+        try:
+            while done_files < len(files):
+                kind, i, payload = results.get()
+                report = reports[i]
+                if kind == "started":
+                    file_started[i] = payload
+                    report["status"] = "processing"
+                    continue
+                if kind == "extracted":
+                    count, seconds, error = payload
+                    expected[i] = count
+                    report["extract_seconds"] = round(seconds, 3)
+                    if error is not None:
+                        self._fail(report, f"Extraction failed: {error}")
+                else:
+                    seq, records, vectors, seconds, error = payload
+                    batches[i][seq] = (records, vectors)
+                    report["embed_seconds"] = round(report["embed_seconds"] + seconds, 3)
+                    if error is not None:
+                        self._fail(report, f"Embedding failed: {error}")
+                    else:
+                        embedded += len(records)
+                if expected[i] is not None and len(batches[i]) == expected[i]:
+                    done_files += 1
+                    if report["status"] != "failed":
+                        report["status"] = "embedded"
+                    report["seconds"] = round(time.perf_counter() - file_started[i], 3)
+                    if on_progress:
+                        on_progress("embedding", done_files, embedded)
+        finally:
+            stop.set()
+            for _ in embedders:
+                embed_queue.put(_STOP)
+
+        if on_progress:
+            on_progress("indexing", done_files, embedded)
+        documents = []
+        for f, report, file_batches in zip(files, reports, batches):
+            if report["status"] == "failed":
+                continue
+            texts, metadatas, vectors = [], [], []
+            for seq in sorted(file_batches):
+                records, batch_vectors = file_batches[seq]
+                texts.extend(text for text, _ in records)
+                metadatas.extend(metadata for _, metadata in records)
+                vectors.extend(batch_vectors)
+            documents.append((f["source"], texts, metadatas, vectors))
+            report["chunks"] = len(texts)
+            report["status"] = "indexed"
+
+        commit_start = time.perf_counter()
+        chunks = self.index_manager.commit_documents(documents)
+        commit_seconds = time.perf_counter() - commit_start
+        failed = sum(r["status"] == "failed" for r in reports)
+        print(f"✓ Ingested {len(files) - failed}/{len(files)} files ({chunks} chunks) in {time.perf_counter() - started:.2f}s")
+        return {
+            "files": reports,
+            "chunks": chunks,
+            "failed": failed,
+            "commit_seconds": round(commit_seconds, 3),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+    @staticmethod
+    def _fail(report: dict, error: str) -> None:
+        report["status"] = "failed"
+        report["error"] = report["error"] or error
+        print(f"⚠️  {report['source']}: {error}")
+
+    @staticmethod
+    def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+        """Put into a bounded queue, giving up once the pipeline is stopped."""
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _extract(self, files, file_queue, embed_queue, results, stop) -> None:
+        """Stage 1: read and chunk files, emitting batches of (text, metadata) records."""
+        while not stop.is_set():
+            try:
+                i = file_queue.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            results.put(("started", i, start))
+            if not self._emit(files, i, lambda f: self.reader.iter_chunks(f["path"]), start, embed_queue, results, stop):
+                return
+
+    def _extract_images(self, files, images, embed_queue, results, stop) -> None:
+        """Stage 1 for a batch's images: OCR them on the process pool, in order."""
+        start = time.perf_counter()
+        for i in images:
+            results.put(("started", i, start))
+        ocr = iter_texts_from_images([files[i]["path"] for i in images])
+        for i, (text, error) in zip(images, ocr):
+            if stop.is_set():
+                return
+
+            def chunks(f, text=text, error=error):
+                if error is not None:
+                    raise RuntimeError(error)
+                return self.reader.chunk_pages([(1, text)])
+
+            if not self._emit(files, i, chunks, start, embed_queue, results, stop):
+                return
+            start = time.perf_counter()
+
+    def _emit(self, files, i, chunks, start, embed_queue, results, stop) -> bool:
+        """
+        Queue a file's chunks for embedding in batches, then report it extracted.
+
+        Returns False if the pipeline was stopped first.
+        """
+        f = files[i]
+        seq, batch, chunk_no, error = 0, [], 0, None
+        try:
+            for chunk in chunks(f):
+                batch.append(self.index_manager.chunk_record(f["source"], chunk, chunk_no, f.get("sha256")))
+                chunk_no += 1
+                if len(batch) >= self.batch_size:
+                    if not self._put(embed_queue, (i, seq, batch), stop):
+                        return False
+                    seq, batch = seq + 1, []
+            if batch:
+                if not self._put(embed_queue, (i, seq, batch), stop):
+                    return False
+                seq += 1
+        except Exception as e:
+            error = e
+        # Batches already queued still come back, so the collector can
+        # account for every one before closing the file.
+        results.put(("extracted", i, (seq, time.perf_counter() - start, error)))
+        return True
+
+    def _embed(self, embed_queue, results, stop) -> None:
+        """Stage 2: embed chunk batches from any file."""
+        embeddings = self.index_manager.embeddings
+        while True:
+            item = embed_queue.get()
+            if item is _STOP:
+                return
+            i, seq, records = item
+            if stop.is_set():
+                continue
+            start = time.perf_counter()
+            try:
+                vectors = embeddings.embed_documents([text for text, _ in records])
+                results.put(("embedded", i, (seq, records, vectors, time.perf_counter() - start, None)))
+            except Exception as e:
+                results.put(("embedded", i, (seq, records, None, time.perf_counter() - start, e)))
@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Optional
+
+TERMINAL_STATES = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's worker thread once the job has been cancelled."""
+
+
+class QueueFull(RuntimeError):
+    """Raised when the job queue cannot accept more work."""
+
+
+class Job:
+    """
+    A unit of background work with progress reporting and cancellation.
+
+    The job function runs in a worker thread and calls report() as it moves
+    through stages; each report becomes an event that subscribers receive
+    through JobQueue.events(). report() raises JobCancelled once cancel() has
+    been called, so long-running stages stop at their next progress update.
+    """
+
+    def __init__(self, kind: str, fn: Callable[["Job"], Any], loop: asyncio.AbstractEventLoop, **info):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.info = info
+        self.status = "queued"
+        self.stage = None
+        self.progress = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = []
+        self._fn = fn
+        self._loop = loop
+        self._cancelled = threading.Event()
+        self._changed = asyncio.Event()
+
+    def _publish(self, event: dict) -> None:
+        """Record an event and wake subscribers. Must run on the event loop."""
+        self.events.append(event)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _emit(self, **event) -> None:
+        event.setdefault("status", self.status)
+        event.setdefault("stage", self.stage)
+        event.setdefault("progress", self.progress)
+        event["job_id"] = self.id
+        event["time"] = time.time()
+        if self._in_loop():
+            self._publish(event)
+        else:
+            self._loop.call_soon_threadsafe(self._publish, event)
+
+    def _in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def report(self, stage: str, progress: Optional[int] = None, **info) -> None:
+        """Record progress from the worker thread; raises JobCancelled if cancelled."""
+        self.check_cancelled()
+        self.stage = stage
+        if progress is not None:
+            self.progress = progress
+        self._emit(**info)
+
+    def check_cancelled(self) -> None:
+        if self._cancelled.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled.")
+
+    def cancel(self) -> bool:
+        """Request cancellation. Returns False if the job already finished."""
+        if self.status in TERMINAL_STATES:
+            return False
+        self._cancelled.set()
+        if self.status == "queued":
+            self.status = "cancelled"
+            self.finished_at = time.time()
+            self._emit()
+        return True
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            **self.info,
+        }
+
+
+class JobQueue:
+    """
+    Bounded queue of background jobs served by a fixed set of worker tasks.
+
+    Job functions are blocking and run via asyncio.to_thread(), so the event
+    loop stays free for other requests. Finished jobs are kept for inspection
+    until more than max_history have accumulated.
+    """
+
+    def __init__(self, workers: int = 2, max_queued: int = 32, max_history: int = 200):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_history = max_history
+        self.jobs = OrderedDict()
+        self._queue = None
+        self._tasks = []
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for job in self.jobs.values():
+            job.cancel()
+
+    def submit(self, kind: str, fn: Callable[[Job], Any], **info) -> Job:
+        """
+        Enqueue fn(job) to run in the background.
+
+        Raises:
+            QueueFull: If max_queued jobs are already waiting
+        """
+        job = Job(kind, fn, asyncio.get_running_loop(), **info)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull("Too many jobs queued; try again later.")
+        self.jobs[job.id] = job
+        job._emit()
+        self._trim()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def _trim(self) -> None:
+        finished = [j for j in self.jobs.values() if j.status in TERMINAL_STATES]
+        for job in finished[:max(0, len(self.jobs) - self.max_history)]:
+            del self.jobs[job.id]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status == "cancelled":
+                    continue
+                job.status = "running"
+                job.started_at = time.time()
+                job._emit()
+                try:
+                    job.result = await asyncio.to_thread(job._fn, job)
+                    job.status = "done"
+                    job.progress = 100
+                except JobCancelled:
+                    job.status = "cancelled"
+                except Exception as e:
+                    print(f"❌ Job {job.id} ({job.kind}) failed: {e}")
+                    job.status = "failed"
+                    job.error = str(e)
+                job.finished_at = time.time()
+                job._emit(result=job.result, error=job.error)
+            finally:
+                self._queue.task_done()
+
+    async def events(self, job: Job) -> AsyncIterator[dict]:
+        """Yield every event of a job, past and future, until it finishes."""
+        seen = 0
+        while True:
+            changed = job._changed
+            while seen < len(job.events):
+                event = job.events[seen]
+                seen += 1
+                yield event
+            if job.status in TERMINAL_STATES and seen >= len(job.events):
+                return
+            await changed.wait()
+
+    def stats(self) -> dict:
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queued": self.max_queued,
+            "jobs": counts,
+        }
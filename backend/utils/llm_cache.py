@@ -0,0 +1,157 @@
+import contextvars
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+
+# Only these classes may be revived from the cache file.
+_CACHED_TYPES = [Generation, ChatGeneration, AIMessage]
+
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+@contextmanager
+def bypass_llm_cache():
+    """
+    Skip cache lookups for LLM calls made inside this block.
+
+    Fresh responses are still written back, so this doubles as a refresh.
+    The flag is a context variable and follows work handed to
+    asyncio.to_thread() and utils.parallel.
+    """
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+class PromptCache(BaseCache):
+    """
+    SQLite-backed LangChain cache for LLM and chat model responses.
+
+    Registered globally with set_llm_cache(), it covers OllamaLLM, GoogleLLM
+    and ChatOpenAI alike. Entries are keyed on LangChain's llm_string, which
+    carries the provider, model, temperature and sampling parameters, plus
+    a hash of the prompt. Entries older than ttl_seconds are ignored and the
+    least recently used rows are evicted once max_entries is exceeded.
+    """
+
+    def __init__(self, path: str, ttl_seconds: Optional[float] = None, max_entries: int = 50_000):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, value TEXT NOT NULL,
+                created REAL NOT NULL, last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used);
+            """
+        )
+        self._count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if _bypass.get():
+            self.bypassed += 1
+            return None
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+        try:
+            return loads(row[0], allowed_objects=_CACHED_TYPES)
+        except Exception:
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = self._key(prompt, llm_string)
+        value = dumps(list(return_val))
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            # Over-counts replacements; _evict() recounts before deleting.
+            self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        """Drop expired rows, then least recently used ones down to 90% of capacity."""
+        if self.ttl_seconds:
+            cur = self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+            self.evictions += cur.rowcount
+        self._count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = self._count - int(self.max_entries * 0.9)
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+            self._count -= excess
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._count = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_llm_cache(path: str = "./outputs/llm_cache.sqlite") -> PromptCache:
+    """
+    Factory function to create the prompt/response cache from the environment.
+
+    Honours LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS (unset means no expiry)
+    and LLM_CACHE_MAX_ENTRIES.
+    """
+    ttl = os.environ.get("LLM_CACHE_TTL_SECONDS")
+    return PromptCache(
+        path=os.environ.get("LLM_CACHE_PATH", path),
+        ttl_seconds=float(ttl) if ttl else None,
+        max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "50000")),
+    )
@@ -0,0 +1,520 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_core.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import LLM
+from langchain_core.outputs import GenerationChunk
+from langchain_core.prompt_values import PromptValue
+from pydantic import PrivateAttr
+
+from utils.batching import estimate_tokens
+from utils.llm_cache import bypass_llm_cache
+from utils.rate_limiter import (
+    BACKGROUND, OUTPUT_TOKENS_ESTIMATE, AdmissionTimeout, create_provider_limiter, llm_priority,
+)
+
+# Seconds a routed call may take before it counts as a failure and the next provider is tried.
+ROUTER_TIMEOUT = float(os.environ.get("ROUTER_TIMEOUT", "120"))
+# Calls kept per provider for latency percentiles and error rates, and how long they count.
+ROUTER_WINDOW = int(os.environ.get("ROUTER_WINDOW", "50"))
+ROUTER_WINDOW_SECONDS = float(os.environ.get("ROUTER_WINDOW_SECONDS", "300"))
+# Consecutive failures, or error rate over at least ROUTER_MIN_SAMPLES calls, that open a breaker.
+ROUTER_FAILURE_THRESHOLD = int(os.environ.get("ROUTER_FAILURE_THRESHOLD", "3"))
+ROUTER_ERROR_RATE = float(os.environ.get("ROUTER_ERROR_RATE", "0.5"))
+ROUTER_MIN_SAMPLES = int(os.environ.get("ROUTER_MIN_SAMPLES", "10"))
+# Seconds an open breaker waits before probing; doubles on each failed probe up to the max.
+ROUTER_COOLDOWN = float(os.environ.get("ROUTER_COOLDOWN", "30"))
+ROUTER_MAX_COOLDOWN = float(os.environ.get("ROUTER_MAX_COOLDOWN", "300"))
+# How often the background thread looks for providers due a probe.
+ROUTER_PROBE_INTERVAL = float(os.environ.get("ROUTER_PROBE_INTERVAL", "5"))
+# Score multiplier per step down the configured preference order.
+ROUTER_PREFERENCE_PENALTY = float(os.environ.get("ROUTER_PREFERENCE_PENALTY", "0.5"))
+
+PROBE_PROMPT = "Reply with the single word OK."
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+def _prompt_text(prompt) -> str:
+    return prompt if isinstance(prompt, str) else prompt.to_string()
+
+
+def _reservation(prompt) -> int:
+    return estimate_tokens(_prompt_text(prompt)) + OUTPUT_TOKENS_ESTIMATE
+
+
+def _used(prompt, result) -> Optional[int]:
+    """Tokens a finished call used, from its text or completed future; None if unknown."""
+    if hasattr(result, "exception"):
+        if result.cancelled() or result.exception() is not None:
+            return None
+        result = _text(result.result())
+    if not result:
+        return None
+    return estimate_tokens(_prompt_text(prompt)) + estimate_tokens(result)
+
+
+def _text(value) -> str:
+    """Text of an LLM result or stream chunk, whether a string or a message."""
+    if isinstance(value, str):
+        return value
+    content = getattr(value, "content", None)
+    if content is None:
+        content = getattr(value, "text", value)
+    return content if isinstance(content, str) else str(content)
+
+
+class ProviderHealth:
+    """
+    Rolling latency/error window and circuit breaker for one provider.
+
+    The breaker opens after failure_threshold consecutive failures, or when
+    the error rate over the window reaches error_rate. While open the
+    provider receives no traffic; once the cooldown passes a probe is due,
+    and its outcome closes the breaker or reopens it with a doubled cooldown.
+    """
+
+    def __init__(self, name: str, llm, window: int = ROUTER_WINDOW):
+        self.name = name
+        self.llm = llm
+        self.limiter = create_provider_limiter(name, llm)
+        self.calls = deque(maxlen=window)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = ROUTER_COOLDOWN
+        self.opened_at = 0.0
+        self.last_error = None
+        self.total_calls = 0
+        self.total_failures = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def _recent(self) -> List[Tuple[float, bool]]:
+        # Old calls age out, so a provider that stopped getting traffic after
+        # an error is not penalized for it indefinitely.
+        cutoff = time.monotonic() - ROUTER_WINDOW_SECONDS
+        return [(latency, ok) for at, latency, ok in list(self.calls) if at >= cutoff]
+
+    def percentile(self, q: float) -> Optional[float]:
+        latencies = [latency for latency, ok in self._recent() if ok]
+        return float(np.percentile(latencies, q)) if latencies else None
+
+    def error_rate(self) -> float:
+        calls = self._recent()
+        return sum(1 for _, ok in calls if not ok) / len(calls) if calls else 0.0
+
+    def available(self) -> bool:
+        return self.state == CLOSED
+
+    def probe_due(self, now: float) -> bool:
+        return self.state == OPEN and now - self.opened_at >= self.cooldown
+
+    def half_open(self) -> bool:
+        """Move an open breaker to half-open for a probe; False if it is no longer open."""
+        with self._lock:
+            if self.state != OPEN:
+                return False
+            self.state = HALF_OPEN
+            return True
+
+    def reopen(self) -> None:
+        """Put a half-open breaker back to open without counting a failure (the probe never ran)."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+
+    def score(self, rank: int, default_latency: float) -> float:
+        """
+        Lower is better: median latency, inflated by errors, load (calls in
+        flight or queued for admission) and lower preference. Providers without successful calls yet are assumed to be
+        as slow as default_latency, so they do not draw traffic just for
+        being untried.
+        """
+        p50 = self.percentile(50)
+        latency = default_latency if p50 is None else p50
+        return (latency + 0.001) * (1 + 4 * self.error_rate()) * (1 + 0.25 * (self.in_flight + self.limiter.waiting)) * (
+            1 + ROUTER_PREFERENCE_PENALTY * rank
+        )
+
+    def start(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def record(self, latency: float, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self.total_calls += 1
+            self.calls.append((time.monotonic(), latency, error is None))
+            if error is None:
+                self.consecutive_failures = 0
+                if self.state != CLOSED:
+                    print(f"✓ LLM provider {self.name} recovered")
+                self.state = CLOSED
+                self.cooldown = ROUTER_COOLDOWN
+                return
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)[:300]
+            tripped = self.consecutive_failures >= ROUTER_FAILURE_THRESHOLD or (
+                len(self._recent()) >= ROUTER_MIN_SAMPLES and self.error_rate() >= ROUTER_ERROR_RATE
+            )
+            if self.state == HALF_OPEN:
+                self.cooldown = min(self.cooldown * 2, ROUTER_MAX_COOLDOWN)
+                self._open()
+            elif self.state == CLOSED and tripped:
+                self._open()
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        print(f"⚠️  LLM provider {self.name} circuit open for {self.cooldown:.0f}s: {self.last_error}")
+
+    def stats(self) -> dict:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "state": self.state,
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+            "in_flight": self.in_flight,
+            "calls": self.total_calls,
+            "failures": self.total_failures,
+            "cooldown_seconds": self.cooldown if self.state != CLOSED else None,
+            "last_error": self.last_error,
+            "limits": self.limiter.stats(),
+        }
+
+
+class RouterLLM(LLM):
+    """
+    LLM that routes each call to the healthiest of several providers.
+
+    Providers are given in preference order. Each call goes to the
+    available provider with the best score (recent median latency, error
+    rate and load, with a penalty per step down the preference order), and
+    fails over to the next one on an error or after ROUTER_TIMEOUT seconds.
+    Failing providers are taken out of rotation by a circuit breaker and
+    probed from a background thread until they answer again. If every
+    breaker is open, all providers are still tried in order rather than
+    failing outright.
+
+    Every call first waits for admission by the provider's ProviderLimiter
+    (in-flight, RPM and TPM limits, in llm_priority order); a provider that
+    cannot admit a call within LLM_LIMITER_MAX_WAIT seconds is skipped.
+
+    Responses are cached by the wrapped providers, not by the router, so a
+    cached answer is tied to the model that produced it.
+
+    Role-tagged input (a list of messages or a chat prompt value) is handed
+    to the chosen provider as is, so chat models keep the system, user and
+    assistant roles; plain LLM providers flatten it themselves. Results are
+    returned as text either way, like any LLM.
+    """
+
+    timeout: float = ROUTER_TIMEOUT
+    cache: bool = False
+
+    _providers: List[ProviderHealth] = PrivateAttr(default_factory=list)
+    _pool: Any = PrivateAttr(default=None)
+    _prober: Any = PrivateAttr(default=None)
+    _stop: Any = PrivateAttr(default=None)
+
+    def __init__(self, providers: Sequence[Tuple[str, Any]], **kwargs):
+        super().__init__(**kwargs)
+        if not providers:
+            raise ValueError("RouterLLM needs at least one provider.")
+        self._providers = [ProviderHealth(name, llm) for name, llm in providers]
+        self._pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-router")
+        self._stop = threading.Event()
+        self._prober = threading.Thread(target=self._probe_loop, name="llm-router-probe", daemon=True)
+        self._prober.start()
+
+    @property
+    def _llm_type(self) -> str:
+        return "router"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"providers": [p.name for p in self._providers]}
+
+    @property
+    def providers(self) -> List[Any]:
+        """The wrapped LLMs, in preference order."""
+        return [p.llm for p in self._providers]
+
+    def preferred(self):
+        """The LLM the next call would be routed to."""
+        return self._candidates()[0].llm
+
+    def _candidates(self) -> List[ProviderHealth]:
+        known = [p50 for p50 in (p.percentile(50) for p in self._providers) if p50 is not None]
+        default_latency = max(known) if known else 1.0
+        ranked = sorted(
+            ((p.score(rank, default_latency), rank, p) for rank, p in enumerate(self._providers) if p.available()),
+            key=lambda item: item[:2],
+        )
+        candidates = [p for _, _, p in ranked]
+        # Every breaker open: try them all, soonest-due probe first, rather than fail.
+        return candidates or sorted(self._providers, key=lambda p: p.opened_at + p.cooldown)
+
+    def _failed(self, errors: List[str]) -> RuntimeError:
+        return RuntimeError("All LLM providers failed: " + "; ".join(errors))
+
+    # LLM.invoke() and friends flatten messages into one string before
+    # _call() sees them; keep them whole for the providers instead.
+    def invoke(self, input, config=None, *, stop: Optional[List[str]] = None, **kwargs: Any) -> str:
+        if isinstance(input, str):
+            return super().invoke(input, config, stop=stop, **kwargs)
+        return self._call(self._convert_input(input), stop=stop)
+
+    async def ainvoke(self, input, config=None, *, stop: Optional[List[str]] = None, **kwargs: Any) -> str:
+        if isinstance(input, str):
+            return await super().ainvoke(input, config, stop=stop, **kwargs)
+        return await self._acall(self._convert_input(input), stop=stop)
+
+    def stream(self, input, config=None, *, stop: Optional[List[str]] = None, **kwargs: Any) -> Iterator[str]:
+        if isinstance(input, str):
+            yield from super().stream(input, config, stop=stop, **kwargs)
+            return
+        for chunk in self._stream(self._convert_input(input), stop=stop):
+            yield chunk.text
+
+    async def astream(self, input, config=None, *, stop: Optional[List[str]] = None, **kwargs: Any) -> AsyncIterator[str]:
+        if isinstance(input, str):
+            async for token in super().astream(input, config, stop=stop, **kwargs):
+                yield token
+            return
+        async for chunk in self._astream(self._convert_input(input), stop=stop):
+            yield chunk.text
+
+    def _call(
+        self,
+        prompt: Union[str, PromptValue],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        errors = []
+        for provider in self._candidates():
+            try:
+                reserved = provider.limiter.acquire(_reservation(prompt))
+            except AdmissionTimeout as e:
+                errors.append(str(e))
+                continue
+            provider.start()
+            start = time.perf_counter()
+            future = self._pool.submit(contextvars.copy_context().run, provider.llm.invoke, prompt, stop=stop)
+            # The slot is held until the call really finishes, even after a timeout.
+            future.add_done_callback(lambda f, p=provider, r=reserved: p.limiter.release(r, _used(prompt, f)))
+            try:
+                text = _text(future.result(timeout=self.timeout))
+            except FutureTimeout:
+                # The worker thread cannot be interrupted; it finishes in the background.
+                error = TimeoutError(f"no response after {self.timeout:.0f}s")
+                provider.record(time.perf_counter() - start, error)
+                errors.append(f"{provider.name}: {error}")
+                continue
+            except Exception as e:
+                provider.record(time.perf_counter() - start, e)
+                errors.append(f"{provider.name}: {e}")
+                continue
+            provider.record(time.perf_counter() - start)
+            return text
+        raise self._failed(errors)
+
+    async def _acall(
+        self,
+        prompt: Union[str, PromptValue],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        errors = []
+        for provider in self._candidates():
+            try:
+                reserved = await provider.limiter.aacquire(_reservation(prompt))
+            except AdmissionTimeout as e:
+                errors.append(str(e))
+                continue
+            provider.start()
+            start = time.perf_counter()
+            text = None
+            try:
+                text = _text(await asyncio.wait_for(provider.llm.ainvoke(prompt, stop=stop), self.timeout))
+            except asyncio.TimeoutError:
+                error = TimeoutError(f"no response after {self.timeout:.0f}s")
+                provider.record(time.perf_counter() - start, error)
+                errors.append(f"{provider.name}: {error}")
+                continue
+            except Exception as e:
+                provider.record(time.perf_counter() - start, e)
+                errors.append(f"{provider.name}: {e}")
+                continue
+            finally:
+                provider.limiter.release(reserved, _used(prompt, text))
+            provider.record(time.perf_counter() - start)
+            return text
+        raise self._failed(errors)
+
+    def _stream(
+        self,
+        prompt: Union[str, PromptValue],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        """Stream from the best provider, failing over only until the first token."""
+        errors = []
+        for provider in self._candidates():
+            try:
+                reserved = provider.limiter.acquire(_reservation(prompt))
+            except AdmissionTimeout as e:
+                errors.append(str(e))
+                continue
+            provider.start()
+            start = time.perf_counter()
+            parts = []
+            try:
+                for part in provider.llm.stream(prompt, stop=stop):
+                    token = _text(part)
+                    if not token:
+                        continue
+                    parts.append(token)
+                    chunk = GenerationChunk(text=token)
+                    if run_manager:
+                        run_manager.on_llm_new_token(token, chunk=chunk)
+                    yield chunk
+            except Exception as e:
+                provider.record(time.perf_counter() - start, e)
+                if parts:
+                    raise
+                errors.append(f"{provider.name}: {e}")
+                continue
+            finally:
+                provider.limiter.release(reserved, _used(prompt, "".join(parts)))
+            provider.record(time.perf_counter() - start)
+            return
+        raise self._failed(errors)
+
+    async def _astream(
+        self,
+        prompt: Union[str, PromptValue],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        """Async variant of _stream; the wait for the first token is bounded by timeout."""
+        errors = []
+        for provider in self._candidates():
+            try:
+                reserved = await provider.limiter.aacquire(_reservation(prompt))
+            except AdmissionTimeout as e:
+                errors.append(str(e))
+                continue
+            provider.start()
+            start = time.perf_counter()
+            parts = []
+            stream = provider.llm.astream(prompt, stop=stop).__aiter__()
+            try:
+                try:
+                    part = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    provider.record(time.perf_counter() - start)
+                    return
+                except asyncio.TimeoutError:
+                    error = TimeoutError(f"no response after {self.timeout:.0f}s")
+                    provider.record(time.perf_counter() - start, error)
+                    errors.append(f"{provider.name}: {error}")
+                    await stream.aclose()
+                    continue
+                except Exception as e:
+                    provider.record(time.perf_counter() - start, e)
+                    errors.append(f"{provider.name}: {e}")
+                    continue
+                try:
+                    while True:
+                        token = _text(part)
+                        if token:
+                            parts.append(token)
+                            chunk = GenerationChunk(text=token)
+                            if run_manager:
+                                await run_manager.on_llm_new_token(token, chunk=chunk)
+                            yield chunk
+                        try:
+                            part = await stream.__anext__()
+                        except StopAsyncIteration:
+                            break
+                except Exception as e:
+                    provider.record(time.perf_counter() - start, e)
+                    raise
+            finally:
+                provider.limiter.release(reserved, _used(prompt, "".join(parts)))
+            provider.record(time.perf_counter() - start)
+            return
+        raise self._failed(errors)
+
+    def predict(self, prompt: str) -> str:
+        return self._call(prompt)
+
+    def _probe_loop(self) -> None:
+        while not self._stop.wait(ROUTER_PROBE_INTERVAL):
+            now = time.monotonic()
+            for provider in self._providers:
+                if provider.probe_due(now):
+                    self._probe(provider)
+
+    def _probe(self, provider: ProviderHealth) -> None:
+        """
+        Send a tiny uncached prompt to an open provider; the result closes or
+        reopens its breaker. Probes are admitted by the provider's limiter
+        like any other call, at background priority.
+        """
+        if not provider.half_open():
+            return
+        try:
+            with llm_priority(BACKGROUND):
+                reserved = provider.limiter.acquire(_reservation(PROBE_PROMPT))
+        except AdmissionTimeout:
+            provider.reopen()
+            return
+        provider.start()
+        start = time.perf_counter()
+        future = self._pool.submit(self._probe_call, provider.llm)
+        future.add_done_callback(lambda f: provider.limiter.release(reserved, _used(PROBE_PROMPT, f)))
+        try:
+            future.result(timeout=self.timeout)
+        except FutureTimeout:
+            provider.record(time.perf_counter() - start, TimeoutError(f"probe got no response after {self.timeout:.0f}s"))
+        except Exception as e:
+            provider.record(time.perf_counter() - start, e)
+        else:
+            provider.record(time.perf_counter() - start)
+
+    @staticmethod
+    def _probe_call(llm):
+        with bypass_llm_cache():
+            return llm.invoke(PROBE_PROMPT)
+
+    def close(self) -> None:
+        self._stop.set()
+        self._pool.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {p.name: p.stats() for p in self._providers}
+
+
+def create_router_llm(providers: Sequence[Tuple[str, Any]], timeout: Optional[float] = None) -> RouterLLM:
+    """
+    Factory function to create a RouterLLM over (name, llm) pairs in preference order.
+
+    Honours ROUTER_TIMEOUT and the other ROUTER_* settings.
+    """
+    return RouterLLM(providers, timeout=timeout or ROUTER_TIMEOUT)
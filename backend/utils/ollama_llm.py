@@ -1,8 +1,71 @@
+import asyncio
+import json
 import os
-from typing import Optional, List, Any
+import threading
+import weakref
+from typing import Optional, List, Any, AsyncIterator, Dict, Iterator
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from langchain_core.language_models import LLM
-from langchain_core.callbacks.manager import CallbackManagerForLLMRun
+from langchain_core.callbacks.manager import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.outputs import GenerationChunk
+
+# Max pooled keep-alive connections per Ollama server.
+POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "16"))
+
+_sessions: Dict[str, requests.Session] = {}
+# Async clients per event loop, then per server; dropped with their loop.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+_clients_lock = threading.Lock()
+
+
+def _get_session(base_url: str) -> requests.Session:
+    """Return a shared keep-alive session for an Ollama server."""
+    with _clients_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[base_url] = session
+        return session
+
+
+def _get_async_client(base_url: str) -> httpx.AsyncClient:
+    """
+    Return a shared async client for an Ollama server.
+
+    httpx clients are bound to the event loop they were first used on, so
+    one client is kept per server and loop. Close them with
+    aclose_async_clients() before the loop shuts down.
+    """
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(base_url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+                timeout=None,
+            )
+            clients[base_url] = client
+        return client
+
+
+async def aclose_async_clients() -> None:
+    """Close the async clients created on the running event loop (e.g. on app shutdown)."""
+    with _clients_lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
 
 
 class OllamaLLM(LLM):
@@ -19,6 +82,8 @@ class OllamaLLM(LLM):
     top_p: float = 0.95
     top_k: int = 40
     num_predict: int = 2048  # Max tokens to generate
+    keep_alive: Optional[str] = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")  # How long Ollama keeps the model loaded
+    timeout: float = 300  # Seconds to wait for a generation
 
     def __init__(self, **kwargs):
         """
@@ -35,7 +100,7 @@ class OllamaLLM(LLM):
         
         # Verify Ollama is running
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = _get_session(self.base_url).get(f"{self.base_url}/api/tags", timeout=5)
             if response.status_code == 200:
                 available_models = [m["name"].split(":")[0] for m in response.json().get("models", [])]
                 print(f"✓ Ollama is running with models: {available_models}")
@@ -61,6 +126,36 @@ class OllamaLLM(LLM):
         """Return type of llm."""
         return "ollama"
 
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        """Parameters that identify this model's output, used as the cache key."""
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "top_k": self.top_k,
+            "num_predict": self.num_predict,
+        }
+
+    def _payload(self, prompt: str, stop: Optional[List[str]], stream: bool) -> dict:
+        """Build an /api/generate request body."""
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "temperature": self.temperature,
+                "top_p": self.top_p,
+                "top_k": self.top_k,
+                "num_predict": self.num_predict,
+            },
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        if stop:
+            payload["options"]["stop"] = stop
+        return payload
+
     def _call(
         self,
         prompt: str,
@@ -81,23 +176,10 @@ class OllamaLLM(LLM):
             Generated text response
         """
         try:
-            payload = {
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "temperature": self.temperature,
-                "top_p": self.top_p,
-                "top_k": self.top_k,
-                "num_predict": self.num_predict,
-            }
-            
-            if stop:
-                payload["stop"] = stop
-            
-            response = requests.post(
+            response = _get_session(self.base_url).post(
                 f"{self.base_url}/api/generate",
-                json=payload,
-                timeout=300  # 5 minutes timeout for long generations
+                json=self._payload(prompt, stop, stream=False),
+                timeout=self.timeout,
             )
             
             if response.status_code != 200:
@@ -113,6 +195,107 @@ class OllamaLLM(LLM):
         except Exception as e:
             raise RuntimeError(f"Ollama generation error: {str(e)}")
 
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        """Stream tokens from Ollama as they are generated."""
+        try:
+            with _get_session(self.base_url).post(
+                f"{self.base_url}/api/generate",
+                json=self._payload(prompt, stop, stream=True),
+                timeout=self.timeout,
+                stream=True,
+            ) as response:
+                if response.status_code != 200:
+                    raise RuntimeError(f"Ollama error: {response.status_code} - {response.text}")
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise RuntimeError(f"Ollama error: {data['error']}")
+                    token = data.get("response", "")
+                    if token:
+                        chunk = GenerationChunk(text=token)
+                        if run_manager:
+                            run_manager.on_llm_new_token(token, chunk=chunk)
+                        yield chunk
+                    if data.get("done"):
+                        break
+        except requests.exceptions.Timeout:
+            raise RuntimeError("Ollama request timed out. Model generation took too long.")
+        except requests.exceptions.ConnectionError:
+            raise RuntimeError(f"Cannot connect to Ollama at {self.base_url}")
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        """
+        Generate text using Ollama without blocking the event loop.
+
+        Requests share a pooled keep-alive connection per server.
+        """
+        try:
+            response = await _get_async_client(self.base_url).post(
+                "/api/generate",
+                json=self._payload(prompt, stop, stream=False),
+                timeout=self.timeout,
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"Ollama error: {response.status_code} - {response.text}")
+            return response.json().get("response", "")
+        except httpx.TimeoutException:
+            raise RuntimeError("Ollama request timed out. Model generation took too long.")
+        except httpx.ConnectError:
+            raise RuntimeError(f"Cannot connect to Ollama at {self.base_url}")
+        except Exception as e:
+            raise RuntimeError(f"Ollama generation error: {str(e)}")
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        """Stream tokens from Ollama without blocking the event loop."""
+        try:
+            async with _get_async_client(self.base_url).stream(
+                "POST",
+                "/api/generate",
+                json=self._payload(prompt, stop, stream=True),
+                timeout=self.timeout,
+            ) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    raise RuntimeError(f"Ollama error: {response.status_code} - {body.decode(errors='replace')}")
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise RuntimeError(f"Ollama error: {data['error']}")
+                    token = data.get("response", "")
+                    if token:
+                        chunk = GenerationChunk(text=token)
+                        if run_manager:
+                            await run_manager.on_llm_new_token(token, chunk=chunk)
+                        yield chunk
+                    if data.get("done"):
+                        break
+        except httpx.TimeoutException:
+            raise RuntimeError("Ollama request timed out. Model generation took too long.")
+        except httpx.ConnectError:
+            raise RuntimeError(f"Cannot connect to Ollama at {self.base_url}")
+
     def predict(self, prompt: str) -> str:
         """
         Convenience method to generate text (for backwards compatibility).
@@ -0,0 +1,88 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+# Default number of in-flight LLM calls per provider. A single local Ollama
+# server serves only a few requests at once; hosted APIs take many more.
+DEFAULT_CONCURRENCY = {
+    "ollama": 2,
+    "google_generative_ai": 8,
+    "openai-chat": 8,
+}
+
+
+def concurrency_for(llm) -> int:
+    """
+    Return the concurrency limit for an LLM's provider.
+
+    Reads LLM_CONCURRENCY_<PROVIDER> (e.g. LLM_CONCURRENCY_OLLAMA), then
+    LLM_CONCURRENCY, then falls back to DEFAULT_CONCURRENCY. A RouterLLM
+    uses the limit of the provider it currently prefers.
+    """
+    if hasattr(llm, "preferred"):
+        llm = llm.preferred()
+    llm_type = getattr(llm, "_llm_type", "") or ""
+    key = "LLM_CONCURRENCY_" + llm_type.split("_")[0].split("-")[0].upper()
+    value = os.environ.get(key) or os.environ.get("LLM_CONCURRENCY")
+    if value:
+        return max(1, int(value))
+    return DEFAULT_CONCURRENCY.get(llm_type, 4)
+
+
+def iter_completed(
+    fn: Callable[[Any], Any],
+    items: Sequence[Any],
+    max_workers: int,
+) -> Iterator[Tuple[int, Any, Optional[BaseException]]]:
+    """
+    Run fn over items on a bounded thread pool and yield results as they finish.
+
+    Yields (index, result, error) tuples in completion order. A failing item
+    yields its exception instead of aborting the others.
+    """
+    if not items:
+        return
+    if max_workers <= 1:
+        for i, item in enumerate(items):
+            try:
+                yield i, fn(item), None
+            except Exception as e:
+                yield i, None, e
+        return
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        # Copy the caller's context so context variables follow each task.
+        futures = {
+            pool.submit(contextvars.copy_context().run, fn, item): i
+            for i, item in enumerate(items)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                yield i, future.result(), None
+            except Exception as e:
+                yield i, None, e
+
+
+def map_ordered(
+    fn: Callable[[Any], Any],
+    items: Sequence[Any],
+    max_workers: int,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[Any]:
+    """
+    Like iter_completed, but return results in input order.
+
+    Failed items come back as None. on_progress(done, total) is called each
+    time an item finishes.
+    """
+    results: List[Any] = [None] * len(items)
+    for done, (i, result, error) in enumerate(iter_completed(fn, items, max_workers), 1):
+        if error is not None:
+            print(f"⚠️  Item {i} failed: {error}")
+        else:
+            results[i] = result
+        if on_progress:
+            on_progress(done, len(items))
+    return results
@@ -1,30 +1,241 @@
 import fitz  # PyMuPDF
+import hashlib
+import multiprocessing
 import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+# Paragraphs per block when streaming .docx files, which have no pages.
+DOCX_BLOCK_PARAGRAPHS = 50
+# Characters per block when streaming plain text files.
+TXT_BLOCK_CHARS = 64 * 1024
+# Image formats read with OCR.
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+def _available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+# Worker processes for extraction and OCR; 1 disables the process pool.
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS") or _available_cpus())
+# PDF pages handed to a worker at a time.
+PAGES_PER_UNIT = int(os.environ.get("EXTRACT_PAGES_PER_UNIT", "8"))
+# Smaller PDFs are cheaper to extract inline than to ship to the pool.
+PARALLEL_MIN_PAGES = int(os.environ.get("EXTRACT_PARALLEL_MIN_PAGES", "32"))
+
+# Scanned-page OCR: pages with fewer than OCR_MIN_CHARS characters of text
+# are rasterized at OCR_DPI and OCR-ed; results are cached by page hash.
+OCR_ENABLED = os.environ.get("PDF_OCR", "1").lower() not in ("0", "false", "no")
+OCR_MIN_CHARS = int(os.environ.get("PDF_OCR_MIN_CHARS", "25"))
+OCR_DPI = int(os.environ.get("PDF_OCR_DPI", "300"))
+OCR_LANG = os.environ.get("PDF_OCR_LANG", "eng")
+OCR_CACHE_DIR = os.environ.get("OCR_CACHE_DIR", "./outputs/ocr_cache")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_extraction_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Return the shared extraction process pool, or None when disabled.
+
+    Workers are spawned rather than forked, since the server process already
+    runs threads (FAISS, HTTP clients) that are unsafe to fork.
+    """
+    global _pool
+    if EXTRACT_WORKERS <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+def shutdown_extraction_pool() -> None:
+    """Stop the extraction workers, if any were started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+def _ordered_results(pool: ProcessPoolExecutor, fn, units: Sequence, window: int) -> Iterator:
+    """
+    Run fn over units on the pool and yield results in input order.
+
+    At most window units are in flight, so results are streamed instead of
+    piling up in memory for very large documents.
+    """
+    pending = deque()
+    for unit in units:
+        pending.append(pool.submit(fn, *unit))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def _needs_ocr(text: str) -> bool:
+    """True if a page has too little extractable text to be a digital page."""
+    return OCR_ENABLED and len(text.strip()) < OCR_MIN_CHARS
+
+def _page_fingerprint(doc, page) -> str:
+    """
+    Hash what a page draws: its content stream and embedded image data.
+
+    Identical scanned pages share a fingerprint across files, so their OCR
+    result can be reused without rasterizing them again.
+    """
+    h = hashlib.sha256(f"{OCR_DPI}:{OCR_LANG}".encode())
+    h.update(page.read_contents())
+    for image in page.get_images(full=True):
+        h.update(doc.xref_stream_raw(image[0]) or b"")
+    return h.hexdigest()
+
+def _ocr_page(doc, page) -> Optional[str]:
+    """
+    OCR one rasterized PDF page, consulting the on-disk OCR cache first.
+
+    Returns None if OCR is unavailable, so callers keep the text layer.
+    """
+    try:
+        import pytesseract
+        from PIL import Image
+    except ImportError:
+        return None
+
+    key = _page_fingerprint(doc, page)
+    cache_path = os.path.join(OCR_CACHE_DIR, f"{key}.txt")
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    pix = page.get_pixmap(dpi=OCR_DPI)
+    img = Image.frombytes("RGB" if pix.alpha == 0 else "RGBA", (pix.width, pix.height), pix.samples)
+    try:
+        text = pytesseract.image_to_string(img, lang=OCR_LANG)
+    except Exception as e:
+        print(f"⚠️  OCR failed for page {page.number + 1}: {e}")
+        return None
+
+    os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, cache_path)
+    return text
+
+def _ocr_pdf_page(path: str, index: int) -> Optional[str]:
+    """Worker: OCR a single page of a PDF."""
+    with fitz.open(path) as doc:
+        return _ocr_page(doc, doc[index])
+
+def _extract_pdf_range(path: str, start: int, end: int) -> List[str]:
+    """Worker: extract text for pages [start, end) of a PDF, OCR-ing scanned ones."""
+    with fitz.open(path) as doc:
+        texts = []
+        for i in range(start, end):
+            text = doc[i].get_text()
+            if _needs_ocr(text):
+                text = _ocr_page(doc, doc[i]) or text
+            texts.append(text)
+        return texts
+
+def _iter_pdf_pages_inline(path: str, doc, pool: Optional[ProcessPoolExecutor]) -> Iterator[Tuple[int, str]]:
+    """
+    Read text layers page by page in this process, OCR-ing scanned pages as
+    they come up.
+
+    With a pool, scanned pages are OCR-ed there while later pages are read;
+    at most 2 * EXTRACT_WORKERS pages are held back so output stays in order.
+    """
+    window = 2 * EXTRACT_WORKERS
+    pending = deque()
+    for i, page in enumerate(doc):
+        text, future = page.get_text(), None
+        if _needs_ocr(text):
+            if pool is None:
+                text = _ocr_page(doc, page) or text
+            else:
+                future = pool.submit(_ocr_pdf_page, path, i)
+        pending.append((i + 1, text, future))
+        while pending and (pending[0][2] is None or len(pending) > window):
+            page_num, text, future = pending.popleft()
+            yield page_num, (future.result() if future else None) or text
+    while pending:
+        page_num, text, future = pending.popleft()
+        yield page_num, (future.result() if future else None) or text
+
+def iter_pdf_pages(path: str) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page_number, text) for each page of a PDF, one page at a time.
+
+    Pages with little or no text layer are rasterized at OCR_DPI and run
+    through Tesseract; pages that already have text are never OCR-ed.
+    Large PDFs are split into PAGES_PER_UNIT-page ranges that are extracted
+    on the process pool; pages still come back in order.
+    """
+    with fitz.open(path) as doc:
+        page_count = doc.page_count
+        pool = get_extraction_pool()
+        if pool is None or page_count < PARALLEL_MIN_PAGES:
+            yield from _iter_pdf_pages_inline(path, doc, pool)
+            return
+
+    units = [(path, start, min(start + PAGES_PER_UNIT, page_count)) for start in range(0, page_count, PAGES_PER_UNIT)]
+    page_num = 0
+    for texts in _ordered_results(pool, _extract_pdf_range, units, window=2 * EXTRACT_WORKERS):
+        for text in texts:
+            page_num += 1
+            yield page_num, text
 
 def extract_text_from_pdf(path: str) -> str:
     """Extract text from PDF files."""
-    doc = fitz.open(path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
+    return "".join(text for _, text in iter_pdf_pages(path))
 
-def extract_text_from_pptx(path: str) -> str:
-    """Extract text from PowerPoint slides (.pptx files)."""
+def iter_pptx_slides(path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (slide_number, text) for each slide of a PowerPoint file."""
     try:
         from pptx import Presentation
     except ImportError:
         raise ImportError("python-pptx is required for PowerPoint support. Install with: pip install python-pptx")
     
     prs = Presentation(path)
-    text = ""
     for slide_num, slide in enumerate(prs.slides, 1):
-        text += f"\n--- Slide {slide_num} ---\n"
+        parts = [f"\n--- Slide {slide_num} ---\n"]
         for shape in slide.shapes:
             if hasattr(shape, "text"):
-                text += shape.text + "\n"
-    return text
+                parts.append(shape.text + "\n")
+        yield slide_num, "".join(parts)
+
+def extract_text_from_pptx(path: str) -> str:
+    """Extract text from PowerPoint slides (.pptx files)."""
+    return "".join(text for _, text in iter_pptx_slides(path))
+
+def _ocr_image_safe(path: str) -> Tuple[Optional[str], Optional[str]]:
+    """Worker: OCR one image, returning (text, None) or (None, error message)."""
+    try:
+        return extract_text_from_image(path), None
+    except Exception as e:
+        return None, str(e)
+
+def iter_texts_from_images(paths: Sequence[str]) -> Iterator[Tuple[Optional[str], Optional[str]]]:
+    """
+    OCR many images on the process pool, yielding (text, error) per path in order.
+
+    At most 2 * EXTRACT_WORKERS images are in flight; a failing image yields
+    its error message instead of stopping the others.
+    """
+    pool = get_extraction_pool()
+    if pool is None or len(paths) < 2:
+        for p in paths:
+            yield _ocr_image_safe(p)
+        return
+    yield from _ordered_results(pool, _ocr_image_safe, [(p,) for p in paths], window=2 * EXTRACT_WORKERS)
 
 def extract_text_from_image(path: str) -> str:
     """Extract text from images (handwritten notes, screenshots) using OCR."""
@@ -41,18 +252,39 @@ def extract_text_from_image(path: str) -> str:
     except Exception as e:
         raise Exception(f"Failed to extract text from image {path}: {e}")
 
-def extract_text_from_docx(path: str) -> str:
-    """Extract text from Word documents (.docx files)."""
+def iter_docx_blocks(path: str) -> Iterator[Tuple[Optional[int], str]]:
+    """Yield (None, text) blocks of paragraphs from a Word document."""
     try:
         from docx import Document
     except ImportError:
         raise ImportError("python-docx is required for Word document support. Install with: pip install python-docx")
     
     doc = Document(path)
-    text = ""
+    block = []
     for para in doc.paragraphs:
-        text += para.text + "\n"
-    return text
+        block.append(para.text + "\n")
+        if len(block) >= DOCX_BLOCK_PARAGRAPHS:
+            yield None, "".join(block)
+            block = []
+    if block:
+        yield None, "".join(block)
+
+def extract_text_from_docx(path: str) -> str:
+    """Extract text from Word documents (.docx files)."""
+    return "".join(text for _, text in iter_docx_blocks(path))
+
+def iter_txt_blocks(path: str) -> Iterator[Tuple[Optional[int], str]]:
+    """Yield (None, text) blocks of a plain text file, split on line boundaries."""
+    with open(path, 'r', encoding='utf-8') as f:
+        block, size = [], 0
+        for line in f:
+            block.append(line)
+            size += len(line)
+            if size >= TXT_BLOCK_CHARS:
+                yield None, "".join(block)
+                block, size = [], 0
+        if block:
+            yield None, "".join(block)
 
 def extract_text_from_txt(path: str) -> str:
     """Extract text from plain text files."""
@@ -74,7 +306,30 @@ def extract_text_from_file(path: str) -> str:
         return extract_text_from_docx(path)
     elif file_ext == '.txt':
         return extract_text_from_txt(path)
-    elif file_ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp']:
+    elif file_ext in IMAGE_EXTENSIONS:
         return extract_text_from_image(path)
     else:
         raise ValueError(f"Unsupported file format: {file_ext}. Supported formats: PDF, PPTX, DOCX, TXT, PNG, JPG, JPEG, GIF, BMP")
+
+def iter_pages_from_file(path: str) -> Iterator[Tuple[Optional[int], str]]:
+    """
+    Stream text from any supported file as (page_number, text) pairs.
+
+    Pages (PDF) and slides (PPTX) are yielded one at a time so the whole
+    document never has to sit in memory. Formats without pages yield blocks
+    with a page number of None; images yield a single page 1.
+    """
+    file_ext = Path(path).suffix.lower()
+    
+    if file_ext == '.pdf':
+        yield from iter_pdf_pages(path)
+    elif file_ext == '.pptx':
+        yield from iter_pptx_slides(path)
+    elif file_ext == '.docx':
+        yield from iter_docx_blocks(path)
+    elif file_ext == '.txt':
+        yield from iter_txt_blocks(path)
+    elif file_ext in IMAGE_EXTENSIONS:
+        yield 1, extract_text_from_image(path)
+    else:
+        raise ValueError(f"Unsupported file format: {file_ext}. Supported formats: PDF, PPTX, DOCX, TXT, PNG, JPG, JPEG, GIF, BMP")
@@ -0,0 +1,323 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from utils.parallel import concurrency_for
+
+# Priorities: lower values are admitted first.
+INTERACTIVE = 0
+BACKGROUND = 1
+BULK = 2
+
+# Default requests and tokens per minute by provider (0 = unlimited). Hosted
+# defaults are conservative; raise them to match your quota tier.
+DEFAULT_RPM = {"ollama": 0, "google": 60, "openai": 500}
+DEFAULT_TPM = {"ollama": 0, "google": 1_000_000, "openai": 200_000}
+# Output tokens reserved per call before the real size is known.
+OUTPUT_TOKENS_ESTIMATE = int(os.environ.get("LLM_OUTPUT_TOKENS_ESTIMATE", "256"))
+# Longest a call may wait for admission before another provider is tried.
+LIMITER_MAX_WAIT = float(os.environ.get("LLM_LIMITER_MAX_WAIT", "300"))
+
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(level: int):
+    """
+    Set the admission priority of LLM calls made inside this block.
+
+    Interactive work (the default) is admitted ahead of BACKGROUND and BULK
+    work waiting on the same provider. The setting is a context variable,
+    so it follows work handed to asyncio.to_thread() and utils.parallel.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class AdmissionTimeout(RuntimeError):
+    """Raised when a call waited longer than allowed for a provider slot."""
+
+
+class TokenBucket:
+    """Bucket refilled continuously at rate_per_minute, holding at most one minute's worth."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (0 if it is now). Caller refills first."""
+        if self.unlimited:
+            return 0.0
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        if not self.unlimited:
+            self.level -= min(amount, self.capacity)
+
+    def give(self, amount: float) -> None:
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "enqueued", "admitted", "abandoned", "loop", "future", "timer")
+
+    def __init__(self, priority: int, seq: int, tokens: int):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.admitted = False
+        self.abandoned = False
+        # Set for async waiters, which are admitted by _dispatch() and woken on their loop.
+        self.loop = None
+        self.future = None
+        self.timer = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class ProviderLimiter:
+    """
+    Admission control for one LLM provider.
+
+    A call is admitted when the provider has a free in-flight slot, a
+    request in its RPM bucket and its estimated tokens in its TPM bucket.
+    Waiting calls form a priority queue: only the first (highest priority,
+    then oldest) may be admitted, so interactive calls overtake queued bulk
+    work as soon as anything frees up. Token reservations are corrected to
+    the actual size once a call returns.
+
+    Threads wait on a condition variable. Async callers wait on a future of
+    their own event loop instead, which is resolved when they are admitted,
+    so no thread is held while they are queued.
+    """
+
+    def __init__(self, name: str, max_in_flight: int, rpm: float = 0, tpm: float = 0,
+                 max_wait: float = LIMITER_MAX_WAIT):
+        self.name = name
+        self.max_in_flight = max(1, max_in_flight)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.admitted = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for w in self._queue if not w.abandoned)
+
+    def _head(self) -> Optional[_Waiter]:
+        while self._queue and self._queue[0].abandoned:
+            heapq.heappop(self._queue)
+        return self._queue[0] if self._queue else None
+
+    def _delay(self, waiter: _Waiter) -> Optional[float]:
+        """0 if waiter can be admitted now, seconds to wait for buckets, or None to wait for a release."""
+        if self._head() is not waiter or self.in_flight >= self.max_in_flight:
+            return None
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return max(self.requests.wait_time(1), self.tokens.wait_time(waiter.tokens))
+
+    def acquire(self, tokens: int, priority: Optional[int] = None) -> int:
+        """
+        Block until the call may proceed.
+
+        Returns:
+            The reserved token count, to pass to release()
+
+        Raises:
+            AdmissionTimeout: If no slot came free within max_wait seconds
+        """
+        with self._cond:
+            waiter = self._enqueue(tokens, priority)
+            deadline = waiter.enqueued + self.max_wait
+            while True:
+                delay = self._delay(waiter)
+                if delay == 0:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._abandon(waiter)
+                    raise AdmissionTimeout(f"{self.name}: no capacity within {self.max_wait:.0f}s")
+                self._cond.wait(remaining if delay is None else min(delay, remaining))
+            self._admit(waiter)
+            # The next waiter may be admissible too (e.g. several free slots).
+            self._dispatch()
+        return waiter.tokens
+
+    def _enqueue(self, tokens: int, priority: Optional[int]) -> _Waiter:
+        capacity = self.tokens.capacity
+        tokens = int(min(tokens, capacity)) if capacity > 0 else int(tokens)
+        waiter = _Waiter(current_priority() if priority is None else priority, next(self._seq), tokens)
+        heapq.heappush(self._queue, waiter)
+        return waiter
+
+    def _admit(self, waiter: _Waiter) -> None:
+        """Admit the head of the queue. Caller holds the lock."""
+        heapq.heappop(self._queue)
+        waiter.admitted = True
+        self.in_flight += 1
+        self.requests.take(1)
+        self.tokens.take(waiter.tokens)
+        self.admitted += 1
+        waited = time.monotonic() - waiter.enqueued
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """Give up a queued waiter's place after a timeout. Caller holds the lock."""
+        waiter.abandoned = True
+        self.timeouts += 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """
+        Admit async waiters at the head of the queue while capacity allows,
+        and wake waiting threads so they re-check. Caller holds the lock.
+        """
+        while True:
+            head = self._head()
+            if head is None or head.loop is None:
+                break
+            delay = self._delay(head)
+            if delay is None:
+                break
+            try:
+                if delay > 0:
+                    # Only the buckets are short; look again once they have refilled.
+                    if not head.timer:
+                        head.timer = True
+                        head.loop.call_soon_threadsafe(head.loop.call_later, delay, self._recheck, head)
+                    break
+                self._admit(head)
+                head.loop.call_soon_threadsafe(_wake, head.future)
+            except RuntimeError:
+                # The waiter's event loop is closed; nobody is left to use the slot.
+                if head.admitted:
+                    self.in_flight -= 1
+                    self.requests.give(1)
+                    self.tokens.give(head.tokens)
+                else:
+                    heapq.heappop(self._queue)
+                head.abandoned = True
+        self._cond.notify_all()
+
+    def _recheck(self, waiter: _Waiter) -> None:
+        with self._cond:
+            waiter.timer = False
+            self._dispatch()
+
+    async def aacquire(self, tokens: int, priority: Optional[int] = None) -> int:
+        """
+        Async variant of acquire(); the wait happens on the event loop.
+
+        If the awaiting task is cancelled, its place in the queue is given
+        up, and a slot granted in the meantime is released again.
+        """
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            waiter = self._enqueue(tokens, priority)
+            waiter.loop, waiter.future = loop, loop.create_future()
+            self._dispatch()
+        try:
+            await asyncio.wait_for(waiter.future, self.max_wait)
+        except asyncio.TimeoutError:
+            with self._cond:
+                if not waiter.admitted:
+                    self._abandon(waiter)
+                    raise AdmissionTimeout(f"{self.name}: no capacity within {self.max_wait:.0f}s")
+        except asyncio.CancelledError:
+            with self._cond:
+                admitted = waiter.admitted
+                if not admitted:
+                    waiter.abandoned = True
+                    self._dispatch()
+            if admitted:
+                self.release(waiter.tokens)
+            raise
+        return waiter.tokens
+
+    def release(self, reserved: int, used: Optional[int] = None) -> None:
+        """Free the in-flight slot and return over-reserved tokens (or charge the shortfall)."""
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            if used is not None:
+                self.tokens.give(reserved - used)
+            self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "waiting": self.waiting,
+            "rpm": self.requests.capacity or None,
+            "tpm": self.tokens.capacity or None,
+            "admitted": self.admitted,
+            "timeouts": self.timeouts,
+            "avg_wait_seconds": round(self.wait_seconds / self.admitted, 3) if self.admitted else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+        }
+
+
+def provider_key(llm) -> str:
+    """Short provider name used in settings, e.g. "ollama", "google" or "openai"."""
+    return (getattr(llm, "_llm_type", "") or "").split("_")[0].split("-")[0].lower()
+
+
+def create_provider_limiter(name: str, llm) -> ProviderLimiter:
+    """
+    Factory function to create a provider's limiter from the environment.
+
+    Reads LLM_RPM_<PROVIDER> and LLM_TPM_<PROVIDER> (e.g. LLM_RPM_GOOGLE;
+    0 disables the limit), falling back to DEFAULT_RPM / DEFAULT_TPM. The
+    in-flight limit is the provider's concurrency (LLM_CONCURRENCY_<PROVIDER>).
+    """
+    key = provider_key(llm)
+    rpm = os.environ.get(f"LLM_RPM_{key.upper()}")
+    tpm = os.environ.get(f"LLM_TPM_{key.upper()}")
+    return ProviderLimiter(
+        name,
+        max_in_flight=concurrency_for(llm),
+        rpm=float(rpm) if rpm else DEFAULT_RPM.get(key, 0),
+        tpm=float(tpm) if tpm else DEFAULT_TPM.get(key, 0),
+    )
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+import aiofiles
+
+# Bytes read from the request per write.
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds the configured size cap."""
+
+
+class UploadStore:
+    """
+    Content-addressed store for uploaded files.
+
+    Uploads are streamed to a temp file in fixed-size chunks while their
+    SHA-256 is computed, then atomically renamed to <sha256><ext>. Memory use
+    is one chunk per upload regardless of file size.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, digest: str, filename: str) -> str:
+        return os.path.join(self.root, digest + Path(filename).suffix.lower())
+
+    async def save(self, upload) -> tuple:
+        """
+        Stream a FastAPI UploadFile into the store.
+
+        Returns (path, sha256 hex digest, size in bytes). If identical content
+        is already stored, the existing file is kept and the copy discarded.
+
+        Raises:
+            UploadTooLarge: If the upload exceeds max_bytes
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        os.close(fd)
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                while chunk := await upload.read(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadTooLarge(f"Upload exceeds the {self.max_bytes} byte limit.")
+                    digest.update(chunk)
+                    await f.write(chunk)
+            path = self.path_for(digest.hexdigest(), upload.filename or "")
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+            return path, digest.hexdigest(), size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def create_upload_store(root: str = "./outputs/uploads") -> UploadStore:
+    """
+    Factory function to create the upload store from the environment.
+
+    Honours UPLOAD_DIR and MAX_UPLOAD_MB (default 500).
+    """
+    return UploadStore(
+        root=os.environ.get("UPLOAD_DIR", root),
+        max_bytes=int(os.environ.get("MAX_UPLOAD_MB", "500")) * 1024 * 1024,
+    )
@@ -9,16 +9,55 @@ const API = axios.create({
 // Extended timeout for long-running operations (10 minutes)
 const LONG_TIMEOUT = 600000; // 10 minutes (600,000 ms)
 
-export const uploadPdf = (file, onUploadProgress) => {
+// Resolves once a background job finishes; onEvent receives each progress event.
+export const waitForJob = (jobId, onEvent) =>
+  new Promise((resolve, reject) => {
+    const eventSource = new EventSource(`http://localhost:8001/jobs/${jobId}/events`);
+    eventSource.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      onEvent && onEvent(data);
+      if (data.status === "done") {
+        eventSource.close();
+        resolve(data);
+      } else if (data.status === "failed" || data.status === "cancelled") {
+        eventSource.close();
+        reject(new Error(data.error || `Job ${data.status}`));
+      }
+    };
+    eventSource.onerror = (err) => {
+      eventSource.close();
+      reject(err);
+    };
+  });
+
+// Uploads a file and waits for its background ingestion job to finish.
+export const uploadPdf = async (file, onUploadProgress, onJobEvent) => {
   const fd = new FormData();
   fd.append("file", file);
-  return API.post("/upload_pdf", fd, { 
+  const res = await API.post("/upload_pdf", fd, { 
+    headers: { "Content-Type": "multipart/form-data" },
+    timeout: LONG_TIMEOUT,
+    onUploadProgress,
+  });
+  if (res.data.job_id) await waitForJob(res.data.job_id, onJobEvent);
+  return res;
+};
+
+// Uploads several files as one batch job; they are indexed together once all are processed.
+export const uploadBatch = async (files, onUploadProgress, onJobEvent) => {
+  const fd = new FormData();
+  files.forEach((file) => fd.append("files", file));
+  const res = await API.post("/upload_batch", fd, {
     headers: { "Content-Type": "multipart/form-data" },
     timeout: LONG_TIMEOUT,
     onUploadProgress,
   });
+  if (res.data.job_id) return waitForJob(res.data.job_id, onJobEvent);
+  return res.data;
 };
 
+export const cancelJob = (jobId) => API.delete(`/jobs/${jobId}`);
+
 export const generateAll = (onProgress) => {
   const eventSource = new EventSource("http://localhost:8001/generate_all");
   eventSource.onmessage = (event) => {
@@ -36,5 +75,28 @@ export const fetchFlashcards = () => API.get("/flashcards");
 export const fetchQuizzes = () => API.get("/quizzes");
 export const fetchPlanner = () => API.get("/planner");
 export const sendChat = (payload) => API.post("/chat", payload);
+// Streams a chat answer over SSE: onEvent receives the "sources" event,
+// then one "token" event per token, then a final "done" event.
+export const streamChat = async (payload, onEvent) => {
+  const response = await fetch("http://localhost:8001/chat_stream", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(payload),
+  });
+  if (!response.ok) throw new Error(`Chat failed: ${response.status}`);
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split("\n\n");
+    buffer = events.pop();
+    for (const event of events) {
+      if (event.startsWith("data: ")) onEvent(JSON.parse(event.slice(6)));
+    }
+  }
+};
 export const submitAnswer = (payload) => API.post("/submit_answer", payload);
 export const downloadPlan = () => API.get("/download_plan", { responseType: 'blob' });
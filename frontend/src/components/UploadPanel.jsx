@@ -1,5 +1,5 @@
 import React, { useState, useRef } from "react";
-import { uploadPdf, generateAll } from "../api";
+import { uploadBatch, generateAll } from "../api";
 
 export default function UploadPanel({ files = [], setFiles = () => {}, onDone, uploadProgress, setUploadProgress, setUploadedFile }){
   const [status, setStatus] = useState("");
@@ -73,15 +73,14 @@ export default function UploadPanel({ files = [], setFiles = () => {}, onDone, u
     setUploadProgress(0);
     
     try {
-      for (let i = 0; i < files.length; i++) {
-        setStatus(`Uploading file ${i + 1}/${files.length}...`);
-        const file = files[i];
-        setUploadedFile(file.name);
-        await uploadPdf(file, (progressEvent) => {
-          const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
-          setUploadProgress(percentCompleted);
-        });
-      }
+      setStatus(`Uploading ${files.length} file${files.length > 1 ? "s" : ""}...`);
+      setUploadedFile(files.map((file) => file.name).join(", "));
+      await uploadBatch(files, (progressEvent) => {
+        const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
+        setUploadProgress(percentCompleted);
+      }, (event) => {
+        if (event.files) setStatus(`Processing files (${event.files_done}/${event.files})...`);
+      });
       
       setStatus("Generating study materials...");
       setGenerationProgress(0);